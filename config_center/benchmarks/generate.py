@@ -0,0 +1,87 @@
+"""
+生成基准测试使用的合成资源库：snow 自身的 namespace 及若干指定配置数量的 namespace，以及 k=v 格式的向导配置内容
+"""
+import os
+import random
+from typing import List
+
+
+# 引用其他配置的配置值占比
+reference_ratio = 0.1
+# 每个模板引用的配置数量
+template_keys = 20
+
+
+def config_key(index: int) -> str:
+    return f'bench_key_{index:06d}'
+
+
+def write_namespace(
+        resources_path: str,
+        namespace: str,
+        keys: int,
+        templates: int,
+        rnd: random.Random,
+        wizard: bool = False
+) -> List[str]:
+    """
+    :param keys: 配置数量
+    :param templates: 模板数量
+    :param wizard: 是否生成 wizard.conf（snow 自身的 namespace 启动时需要）
+    :return: 自定义（customized）配置的配置键
+    """
+    _base = os.path.join(resources_path, namespace)
+    os.makedirs(os.path.join(_base, 'templates'), exist_ok=True)
+    with open(os.path.join(_base, 'VERSION'), mode='w', encoding='utf-8') as f:
+        f.write('1.0.0')
+
+    _customized = []
+    with open(os.path.join(_base, 'cc_configs_meta.tsv'), mode='w', encoding='utf-8') as f:
+        f.write('key\tvalue\tdescription\tlevel\tcategory\n')
+        for _i in range(keys):
+            _key = config_key(_i)
+            _level = rnd.choices(('default', 'customized', 'default_overload'), weights=(80, 10, 10))[0]
+            if _i > 0 and rnd.random() < reference_ratio:
+                _value = f'{{{{ myself["{config_key(rnd.randrange(_i))}"] }}}}:{_i}'
+            else:
+                _value = f'value-{_i}-{rnd.getrandbits(32):08x}'
+            if _level == 'customized':
+                _customized.append(_key)
+            f.write(f'{_key}\t{_value}\tdescription of {_key}\t{_level}\tcategory_{_i % 10}\n')
+
+    with open(os.path.join(_base, 'cc_templates_meta.tsv'), mode='w', encoding='utf-8') as f:
+        f.write('template_name\tdest_address\tdest_path\tdest_user\tdest_passwd\n')
+        for _t in range(templates):
+            f.write(f'template_{_t}.conf\t127.0.0.1:22\t/tmp/snow-bench/{namespace}/template_{_t}.conf\troot\troot\n')
+
+    for _t in range(templates):
+        with open(os.path.join(_base, 'templates', f'template_{_t}.conf'), mode='w', encoding='utf-8') as f:
+            f.write(f'# {namespace} template {_t}\n')
+            for _k in rnd.sample(range(keys), min(template_keys, keys)):
+                f.write(f'{config_key(_k)}={{{{ myself.{config_key(_k)} }}}}\n')
+            f.write('{% for _k in range(3) %}loop_{{ _k }}={{ _k | string | upper }}\n{% endfor %}\n')
+
+    if wizard:
+        with open(os.path.join(_base, 'wizard.conf'), mode='w', encoding='utf-8') as f:
+            for _key in _customized:
+                f.write(f'{_key}=wizard\n')
+    return _customized
+
+
+def kv_content(lines: int, rnd: random.Random) -> str:
+    """
+    :param lines: 行数，其中约 10% 为注释行及空行，部分配置值中包含等号
+    :return: k=v 格式的内容
+    """
+    _rows = []
+    for _i in range(lines):
+        _r = rnd.random()
+        if _r < 0.05:
+            _rows.append(f'# comment {_i}')
+        elif _r < 0.1:
+            _rows.append('')
+        elif _r < 0.2:
+            _rows.append(f'{config_key(_i)}=jdbc:mysql://db:3306/cc?useSSL=false&serverTimezone=UTC')
+        else:
+            _rows.append(f'{config_key(_i)}=value-{_i}-{rnd.getrandbits(32):08x}')
+    return '\n'.join(_rows) + '\n'
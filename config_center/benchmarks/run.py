@@ -0,0 +1,253 @@
+"""
+cc 基准测试：在临时目录中生成合成资源库及 sqlite 数据库（或通过 --db-url 指定数据库），
+测量注册、向导生成、模板渲染、配置读取接口及向导配置解析的耗时，结果以 json 输出，可通过 --compare 与历史结果对比
+
+用法（在 config_center 目录下执行）：
+    python benchmarks/run.py --keys 1000,10000,100000 --output result.json
+    python benchmarks/run.py --keys 1000 --compare result.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import contextlib
+import platform
+import tempfile
+import subprocess
+import statistics
+from datetime import datetime
+from typing import Callable, List
+from sqlalchemy.engine import make_url
+
+
+config_center_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, config_center_path)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import generate  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Config Center benchmarks')
+    parser.add_argument('--keys', default='1000,10000', help='各 namespace 的配置数量，逗号分隔')
+    parser.add_argument('--templates', type=int, default=20, help='每个 namespace 的模板数量')
+    parser.add_argument('--requests', type=int, default=2000, help='单个配置读取接口的请求次数')
+    parser.add_argument('--list-requests', type=int, default=20, help='namespace 全量配置读取接口的请求次数')
+    parser.add_argument('--batch-size', type=int, default=100, help='批量读取接口单次请求的配置数')
+    parser.add_argument('--kv-lines', type=int, default=100000, help='向导配置（k=v 格式）解析及序列化基准的行数')
+    parser.add_argument('--repeat', type=int, default=3, help='注册、向导生成等整体操作的重复次数')
+    parser.add_argument('--seed', type=int, default=20240801, help='随机数种子，相同种子生成相同的资源及请求序列')
+    parser.add_argument('--db-url', default='', help='数据库连接串，默认在临时目录中使用 sqlite')
+    parser.add_argument('--no-cache', action='store_true', help='关闭配置读缓存')
+    parser.add_argument('--output', default='', help='结果输出文件，默认输出到标准输出')
+    parser.add_argument('--compare', default='', help='与指定的历史结果文件对比，输出耗时变化')
+    return parser.parse_args()
+
+
+def summarize(samples: List[float]) -> dict:
+    """
+    :param samples: 每次操作的耗时，单位：秒
+    :return: 次数、吞吐量及耗时分位数（单位：毫秒）
+    """
+    _sorted = sorted(samples)
+
+    def _percentile(p: float) -> float:
+        return _sorted[min(len(_sorted) - 1, int(round(p / 100 * (len(_sorted) - 1))))] * 1000
+
+    return {
+        'count': len(_sorted),
+        'throughput': len(_sorted) / sum(_sorted) if sum(_sorted) else 0.0,
+        'mean_ms': statistics.fmean(_sorted) * 1000,
+        'p50_ms': _percentile(50),
+        'p90_ms': _percentile(90),
+        'p99_ms': _percentile(99),
+        'max_ms': _sorted[-1] * 1000,
+    }
+
+
+def measure(func: Callable[[], object], times: int) -> List[float]:
+    _samples = []
+    for _ in range(times):
+        _start = time.perf_counter()
+        func()
+        _samples.append(time.perf_counter() - _start)
+    return _samples
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=config_center_path, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run(args: argparse.Namespace) -> dict:
+    _work_path = tempfile.mkdtemp(prefix='snow-cc-bench-')
+    _resources_path = os.path.join(_work_path, 'resources')
+    _rnd = random.Random(args.seed)
+    _sizes = [int(_) for _ in args.keys.split(',') if _]
+
+    # 资源库及数据库需在导入 cc 模块前通过环境变量指定
+    os.environ['RESOURCES_PATH'] = _resources_path
+    os.environ['DB_URL'] = args.db_url or f'sqlite:///{os.path.join(_work_path, "cc.db")}'
+    os.environ['JINJA_BYTECODE_CACHE_PATH'] = os.path.join(_work_path, '.jinja_cache')
+    os.environ['LOG_LEVEL'] = 'info'
+    if args.no_cache:
+        os.environ['CONFIG_CACHE_MAX_SIZE'] = '0'
+    os.environ.setdefault('SNOW_NAMESPACE', 'snow')
+    generate.write_namespace(_resources_path, os.environ['SNOW_NAMESPACE'], 50, 2, _rnd, wizard=True)
+    _namespaces = {}
+    for _size in _sizes:
+        _namespace = f'bench_{_size}'
+        _namespaces[_namespace] = (
+            _size,
+            generate.write_namespace(_resources_path, _namespace, _size, args.templates, _rnd)
+        )
+
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session
+    import snow_cc
+    import middlewave
+    from database import engine
+    from models import CcRegistryInfo
+    from crud import CrudCcConfigs
+    from utils.resources_handler import ResourcesHandle
+    from utils.kv_content_analyzer import KVFileContentAnalyzer
+
+    results = {}
+    # 向导配置解析及序列化，与数据库无关
+    if args.kv_lines:
+        _content = generate.kv_content(args.kv_lines, _rnd)
+        _kv_path = os.path.join(_work_path, 'wizard.conf')
+        with open(_kv_path, mode='w', encoding='utf-8') as f:
+            f.write(_content)
+        _parsed = KVFileContentAnalyzer.parse(_content)
+
+        def _iter_parse_file():
+            with open(_kv_path, mode='r', encoding='utf-8') as _f:
+                for _ in KVFileContentAnalyzer.iter_parse(_f, keep_comments=True):
+                    pass
+
+        results['kv_codec'] = {'lines': args.kv_lines, 'keys': len(_parsed), 'benchmarks': {
+            'kv_parse': summarize(measure(lambda: KVFileContentAnalyzer.parse(_content), args.repeat)),
+            'kv_iter_parse_file': summarize(measure(_iter_parse_file, args.repeat)),
+            'kv_unparse': summarize(measure(lambda: KVFileContentAnalyzer.unparse(_parsed), args.repeat)),
+            'kv_round_trip': summarize(measure(
+                lambda: ''.join(KVFileContentAnalyzer.iter_unparse(
+                    KVFileContentAnalyzer.iter_parse(_content, keep_comments=True))),
+                args.repeat
+            )),
+        }}
+
+    with TestClient(snow_cc.cc) as client:
+        for _namespace, (_size, _customized) in _namespaces.items():
+            _result = {}
+            _wizard = ''.join(f'{_k}=bench\n' for _k in _customized)
+
+            with Session(engine) as session:
+                # 首次注册写入全部数据，之后的注册数据无变化
+                _result['registry_cold'] = summarize(measure(
+                    lambda: middlewave.registry(session, CcRegistryInfo(namespace=_namespace, wizard_configs=_wizard)),
+                    1
+                ))
+                _result['registry_unchanged'] = summarize(measure(
+                    lambda: middlewave.registry(session, CcRegistryInfo(namespace=_namespace, wizard_configs=_wizard)),
+                    args.repeat
+                ))
+                _result['execute_wizard'] = summarize(measure(
+                    lambda: middlewave.execute_wizard(session, _namespace), args.repeat))
+
+                _envs = middlewave._load_render_envs(session, _namespace)
+                _templates = [_.template_name for _ in ResourcesHandle.get_library_data(_namespace)[1]]
+                _result['render_template'] = summarize(measure(
+                    lambda: [ResourcesHandle.render_template(_namespace, _t, **_envs) for _t in _templates],
+                    args.repeat
+                ))
+                _result['render_template']['templates'] = len(_templates)
+
+            _keys = [generate.config_key(_rnd.randrange(_size)) for _ in range(args.requests)]
+            _keys_iter = iter(_keys)
+            _result['get_config'] = summarize(measure(
+                lambda: client.get(f'/{_namespace}/configs/{next(_keys_iter)}').raise_for_status(),
+                args.requests
+            ))
+            _result['get_namespace_configs'] = summarize(measure(
+                lambda: client.get(f'/{_namespace}/configs').raise_for_status(),
+                args.list_requests
+            ))
+            _batches = [
+                [{'namespace': _namespace, 'key': _k} for _k in _keys[_i:_i + args.batch_size]]
+                for _i in range(0, len(_keys), args.batch_size)
+            ]
+            _batches_iter = iter(_batches)
+            _result['batch_configs'] = summarize(measure(
+                lambda: client.post('/configs:batch', json=next(_batches_iter)).raise_for_status(),
+                len(_batches)
+            ))
+            _result['batch_configs']['batch_size'] = args.batch_size
+            _result['config_cache'] = CrudCcConfigs.cache_stats()
+            results[_namespace] = {'keys': _size, 'templates': args.templates, 'benchmarks': _result}
+
+    # 结果中不记录数据库密码
+    _db_url = make_url(os.environ['DB_URL']).render_as_string(hide_password=True) if args.db_url else 'sqlite (temporary)'
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'db_url': _db_url,
+            'args': {**vars(args), 'db_url': _db_url},
+        },
+        'results': results
+    }
+
+
+def compare(current: dict, baseline: dict) -> List[str]:
+    """
+    :return: 每项基准的 p50 及 p99 耗时相对历史结果的变化
+    """
+    _lines = [f"baseline: {baseline['meta'].get('revision')}  current: {current['meta'].get('revision')}"]
+    for _namespace, _result in current['results'].items():
+        _base = baseline['results'].get(_namespace)
+        if _base is None:
+            continue
+        for _name, _stats in _result['benchmarks'].items():
+            _base_stats = _base['benchmarks'].get(_name)
+            if _base_stats is None or 'p50_ms' not in _stats:
+                continue
+            _changes = []
+            for _metric in ('p50_ms', 'p99_ms'):
+                _old, _new = _base_stats[_metric], _stats[_metric]
+                _changes.append(
+                    f'{_metric} {_old:.3f} -> {_new:.3f} ({(_new - _old) / _old * 100:+.1f}%)' if _old else
+                    f'{_metric} {_old:.3f} -> {_new:.3f}'
+                )
+            _lines.append(f'{_namespace:>16} {_name:<24} ' + ', '.join(_changes))
+    return _lines
+
+
+def main():
+    args = parse_args()
+    # 服务自身的输出转到标准错误，标准输出仅输出结果
+    with contextlib.redirect_stdout(sys.stderr):
+        result = run(args)
+    _output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, mode='w', encoding='utf-8') as f:
+            f.write(_output)
+    else:
+        print(_output)
+    if args.compare:
+        with open(args.compare, mode='r', encoding='utf-8') as f:
+            _baseline = json.load(f)
+        print('\n'.join(compare(result, _baseline)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import threading
+from typing import Dict, List, NoReturn
+from sqlmodel import Session
+
+import ini
+from crud import CrudCcConfigs, CrudCcRevisions
+from database import engine
+
+
+class RevisionWatcher:
+    """
+    多进程（或多副本）部署时保持读缓存一致：后台线程定时轮询 cc_revisions，更新本进程已知的修订号，
+    发现其他进程写入导致修订号变化的 namespace 时，失效本进程中该 namespace 的读缓存
+    """
+    def __init__(self, interval: float):
+        """
+        :param interval: 轮询间隔，单位：秒，小于等于 0 时不轮询
+        """
+        self._interval = interval
+        self._revisions: Dict[str, int] = {}
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> NoReturn:
+        if self._interval <= 0 or self._thread is not None:
+            return
+        # 启动时记录当前修订号作为基准
+        self.poll()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='cc-revision-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> NoReturn:
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def poll(self) -> List[str]:
+        """
+        :return: 修订号发生变化（已失效读缓存）的 namespace
+        """
+        with Session(engine) as session:
+            _revisions = CrudCcRevisions.read_revisions(session)
+        # 新出现的 namespace 同样失效，本进程可能在首次轮询到它之前已缓存了其旧数据
+        _changed = [_ns for _ns, _r in _revisions.items() if self._revisions.get(_ns) != _r]
+        for _ns in _changed:
+            CrudCcConfigs.invalidate_cache(_ns)
+        CrudCcRevisions.remember(_revisions)
+        self._revisions = _revisions
+        return _changed
+
+    def _run(self) -> NoReturn:
+        while not self._stop_event.wait(self._interval):
+            try:
+                self.poll()
+            except Exception as e:
+                # 数据库暂时不可用时等待下次轮询，读缓存仍受 TTL 约束
+                print(f'Revision polling failed: {type(e).__name__}: {e}')
+
+
+revision_watcher = RevisionWatcher(interval=float(ini.cache_sync_interval))
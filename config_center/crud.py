@@ -1,38 +1,214 @@
+import time
+import asyncio
+import threading
 import datetime
-from typing import List, NoReturn, Optional, Iterable
-from sqlmodel import SQLModel, Session, select
+from typing import List, NoReturn, Optional, Iterable, Dict, Iterator, Tuple
+from sqlalchemy import select as sa_select, literal, func, event
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlmodel import SQLModel, Session, select, update, insert, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
 from jinja2.exceptions import TemplateSyntaxError
 
-from models import CcConfigs, CcNamespaces, CcTemplates, CcConfigsBase
+import ini
+from models import (
+    CcConfigs,
+    CcNamespaces,
+    CcTemplates,
+    CcConfigsBase,
+    CcConfigHistory,
+    CcRevisions,
+    CcDeployRecords,
+    CcJobs,
+    CcLocks,
+    CcRegistryFingerprints
+)
 from errors import (
     CcDataNotFoundError,
-    CcRenderError,
-    CcDataDeleteError
+    CcRenderError
 )
 from utils.jinja_handler import JinjaHandler
+from utils.lru_cache import NamespaceLRUCache, MISSING
+
+
+def create_db_and_tables(engine, retries: int = 3):
+    """
+    多个进程同时启动时，建表可能与其他进程冲突，冲突时重试
+    """
+    for _i in range(retries):
+        try:
+            SQLModel.metadata.create_all(engine)
+            return
+        except DBAPIError:
+            if _i == retries - 1:
+                raise
+            time.sleep(0.5 * (_i + 1))
 
 
-def create_db_and_tables(engine):
-    SQLModel.metadata.create_all(engine)
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending_revisions(session, previous_transaction):
+    # 事务回滚时丢弃其中递增的修订号，savepoint 回滚不影响
+    if previous_transaction.parent is None:
+        session.info.pop('cc_revisions', None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _remember_committed_revisions(session):
+    _revisions = session.info.pop('cc_revisions', None)
+    if _revisions:
+        CrudCcRevisions.remember(_revisions)
 
 
 class Crud:
     @classmethod
-    def create(cls, db: Session, rows: List) -> NoReturn:
-        for row in rows:
-            db.add(row)
-        db.commit()
+    async def _aexec_all(cls, db: Session | AsyncSession, statement) -> list:
+        """
+        异步执行查询：AsyncSession 直接在事件循环中执行，同步 Session 放到线程中执行
+        """
+        if isinstance(db, AsyncSession):
+            return (await db.exec(statement)).all()
+        return await asyncio.to_thread(lambda: db.exec(statement).all())
 
     @classmethod
-    def delete(cls, db: Session, statement) -> NoReturn:
-        all_row = db.exec(statement).all()
+    async def _aget(cls, db: Session | AsyncSession, model, primary_key):
+        if isinstance(db, AsyncSession):
+            return await db.get(model, primary_key)
+        return await asyncio.to_thread(db.get, model, primary_key)
 
-        for _r in all_row:
-            db.delete(_r)
-        db.commit()
+    @classmethod
+    def _sync_namespace_rows(cls, db: Session, model, namespace: str, rows: Iterable[dict]) -> dict:
+        """
+        将 namespace 下的数据同步为 rows，不提交：
+        不存在的行批量插入，有变化的行按主键批量更新，多余的行批量删除，未变化的行不写入
+        :param model: 表模型，主键为 namespace 加一个业务主键字段
+        :param rows: 目标数据，每行为包含全部字段的字典
+        :return: 插入、更新、删除、未变化的行数
+        """
+        _table = model.__table__
+        _key_field = [_c.name for _c in _table.primary_key.columns if _c.name != 'namespace'][0]
+        _fields = [_c.name for _c in _table.columns]
+
+        _target = {}
+        for _row in rows:
+            _target[_row[_key_field]] = _row
+        _existing = {}
+        for _row in db.exec(sa_select(_table).where(_table.c.namespace == namespace)).mappings():
+            _existing[_row[_key_field]] = _row
+
+        _inserts, _updates = [], []
+        for _k, _row in _target.items():
+            _old = _existing.get(_k)
+            if _old is None:
+                _inserts.append(_row)
+            elif any(_row[_f] != _old[_f] for _f in _fields):
+                _updates.append(_row)
+        _deletes = [_k for _k in _existing if _k not in _target]
+
+        if _inserts:
+            db.exec(insert(model), params=_inserts)
+        if _updates:
+            db.exec(update(model), params=_updates)
+        for _i in range(0, len(_deletes), 1000):
+            db.exec(
+                delete(model).where(
+                    _table.c.namespace == namespace
+                ).where(
+                    _table.c[_key_field].in_(_deletes[_i:_i + 1000])
+                )
+            )
+        if _inserts or _updates or _deletes:
+            cls._bump_revision(db, [namespace])
+            cls._record_changes(db, [
+                *[(None, _row) for _row in _inserts],
+                *[(dict(_existing[_row[_key_field]]), _row) for _row in _updates],
+                *[(dict(_existing[_k]), None) for _k in _deletes]
+            ])
+
+        return {
+            'inserted': len(_inserts),
+            'updated': len(_updates),
+            'deleted': len(_deletes),
+            'unchanged': len(_target) - len(_inserts) - len(_updates)
+        }
 
-        if db.exec(statement).all():
-            raise CcDataDeleteError(f'Table delete rows failed.')
+    @classmethod
+    def _clone_namespace_rows(cls, db: Session, model, source: str, target: str, **values) -> int:
+        """
+        以 INSERT ... SELECT 将 source 下的全部行复制到 target，数据不经过应用，不提交
+        :param values: 需设为指定值（而非复制原值）的字段
+        :return: 复制的行数
+        """
+        _table = model.__table__
+        _values = {'namespace': target, **values}
+        _result = db.exec(
+            insert(model).from_select(
+                [_c.name for _c in _table.columns],
+                sa_select(
+                    *[
+                        literal(_values[_c.name], _c.type).label(_c.name) if _c.name in _values else _c
+                        for _c in _table.columns
+                    ]
+                ).where(
+                    _table.c.namespace == source
+                )
+            )
+        )
+        if _result.rowcount:
+            cls._bump_revision(db, [target])
+        return _result.rowcount
+
+    @classmethod
+    def _update_namespace_rows(cls, db: Session, model, namespace: str, rows: List[dict]) -> NoReturn:
+        """
+        按主键批量更新 namespace 下的行，不提交
+        :param rows: 每行包含业务主键字段及需要更新的字段
+        """
+        if not rows:
+            return
+        db.exec(update(model), params=[{'namespace': namespace, **_r} for _r in rows])
+        cls._bump_revision(db, [namespace])
+
+    @classmethod
+    def _bump_revision(cls, db: Session, namespaces: Iterable[str]) -> NoReturn:
+        """
+        递增 namespace 的修订号，不提交，随调用方的写操作在同一个事务中提交
+        :param namespaces: 发生写操作的 namespace
+        """
+        for _ns in set(namespaces):
+            while True:
+                # 使用 revision = revision + 1 原地自增，避免并发写入时丢失修订号
+                _result = db.exec(
+                    update(CcRevisions).where(
+                        CcRevisions.namespace == _ns
+                    ).values(
+                        revision=CcRevisions.revision + 1,
+                        update_time=datetime.datetime.now()
+                    )
+                )
+                if _result.rowcount:
+                    break
+                # 首次写入时创建修订号，放在 savepoint 中，并发的首次写入已创建时只回滚本次插入，重新自增
+                try:
+                    with db.begin_nested():
+                        db.exec(insert(CcRevisions).values(
+                            namespace=_ns,
+                            revision=1,
+                            update_time=datetime.datetime.now()
+                        ))
+                    break
+                except IntegrityError:
+                    continue
+            # 记录本事务递增后的修订号，提交后更新本进程已知的修订号
+            db.info.setdefault('cc_revisions', {})[_ns] = db.exec(
+                sa_select(CcRevisions.revision).where(CcRevisions.namespace == _ns)
+            ).scalar_one()
+
+    @classmethod
+    def _record_changes(cls, db: Session, changes: List[Tuple[Optional[dict], Optional[dict]]]) -> NoReturn:
+        """
+        写操作的变更记录，在 _bump_revision 之后、提交之前调用，默认不记录
+        :param changes: (变更前的行, 变更后的行)，新增时变更前为 None，删除时变更后为 None
+        """
+        pass
 
     @classmethod
     def _render_value(cls, raw_value: str, **envs) -> str:
@@ -47,19 +223,56 @@ class Crud:
 
 
 class CrudCcConfigs(Crud):
+    # 配置读缓存，按 namespace 分区，缓存键为 config_key，None 表示整个 namespace 的查询结果
+    _cache = NamespaceLRUCache(max_size=int(ini.config_cache_max_size), ttl=float(ini.config_cache_ttl))
+
+    @classmethod
+    def invalidate_cache(cls, namespace: str, key: Optional[str] = None) -> NoReturn:
+        if key is None:
+            cls._cache.invalidate(namespace)
+        else:
+            cls._cache.invalidate(namespace, key, None)
+
+    @classmethod
+    def cache_stats(cls) -> dict:
+        return cls._cache.stats()
+
+    @classmethod
+    def _record_changes(cls, db: Session, changes: List[Tuple[Optional[dict], Optional[dict]]]) -> NoReturn:
+        CrudCcConfigHistory.record(db, changes)
+
     @classmethod
-    def create(cls, db: Session, rows: Iterable[CcConfigs], **render_envs) -> NoReturn:
-        rows = list(map(
-            lambda _: CcConfigs(
-                namespace=_.namespace,
-                key=_.key,
-                value=cls._render_value(_.value, **render_envs),
-                description=_.description,
-                category=_.category
-            ),
-            rows
-        ))
-        super().create(db, rows)
+    def sync_namespace_rows(
+            cls,
+            db: Session,
+            namespace: str,
+            rows: Iterable[CcConfigs],
+            commit: bool = True,
+            **render_envs
+    ) -> dict:
+        """
+        渲染并同步 namespace 下的全部配置，仅写入有变化的行
+        :param commit: 是否提交，不提交时由调用方提交并负责失效配置读缓存
+        """
+        _counts = super()._sync_namespace_rows(
+            db,
+            CcConfigs,
+            namespace,
+            map(
+                lambda _: {
+                    'namespace': namespace,
+                    'key': _.key,
+                    'value': cls._render_value(_.value, **render_envs),
+                    'description': _.description,
+                    'category': _.category
+                },
+                rows
+            )
+        )
+        if commit:
+            db.commit()
+            cls.invalidate_cache(namespace)
+        return _counts
 
     @classmethod
     def update_config_value(
@@ -70,76 +283,293 @@ class CrudCcConfigs(Crud):
     ) -> CcConfigs:
         row = db.exec(select(CcConfigs).where(CcConfigs.namespace == data.namespace).where(CcConfigs.key == data.key)).first()
         if row:
+            _old = row.model_dump()
             row.value = cls._render_value(data.value, **render_envs)
             db.add(row)
+            cls._bump_revision(db, [data.namespace])
+            cls._record_changes(db, [(_old, row.model_dump())])
             db.commit()
+            cls.invalidate_cache(data.namespace, data.key)
             db.refresh(row)
             return row
         else:
             raise CcDataNotFoundError
 
     @classmethod
-    def read_by_primary(
-            cls,
-            db: Session,
-            namespace: Optional[str] = None,
-            key: Optional[str] = None
-    ) -> List[CcConfigs]:
+    def update_values(cls, db: Session, namespace: str, values: Dict[str, str], commit: bool = True) -> NoReturn:
+        """
+        批量更新 namespace 下多个配置的值（已渲染），配置键不存在时忽略
+        :param commit: 是否提交，不提交时由调用方提交并负责失效配置读缓存
+        """
+        _old = {}
+        _keys = list(values)
+        for _i in range(0, len(_keys), 1000):
+            _old.update(db.exec(
+                sa_select(CcConfigs.key, CcConfigs.value).where(
+                    CcConfigs.namespace == namespace
+                ).where(
+                    CcConfigs.key.in_(_keys[_i:_i + 1000])
+                )
+            ).all())
+        _rows = [{'key': _k, 'value': _v} for _k, _v in values.items() if _k in _old]
+        super()._update_namespace_rows(db, CcConfigs, namespace, _rows)
+        cls._record_changes(db, [
+            ({'namespace': namespace, 'key': _r['key'], 'value': _old[_r['key']]}, {'namespace': namespace, **_r})
+            for _r in _rows
+        ])
+        if commit:
+            db.commit()
+            cls.invalidate_cache(namespace)
+
+    @classmethod
+    def clone_namespace_rows(cls, db: Session, source: str, target: str, commit: bool = True) -> int:
+        """
+        将 source 下的全部配置复制到 target，配置值不重新渲染
+        :param commit: 是否提交，不提交时由调用方提交并负责失效配置读缓存
+        :return: 复制的行数
+        """
+        _count = super()._clone_namespace_rows(db, CcConfigs, source, target)
+        if _count:
+            CrudCcConfigHistory.record_clone(db, source, target)
+        if commit:
+            db.commit()
+            cls.invalidate_cache(target)
+        return _count
+
+    @classmethod
+    def restore_namespace_rows(cls, db: Session, namespace: str, rows: Iterable[dict], commit: bool = True) -> dict:
+        """
+        将 namespace 下的全部配置同步为 rows（已渲染，不重新渲染），仅写入有变化的行，用于回滚
+        :param rows: 每行包含 key、value、description、category
+        :param commit: 是否提交，不提交时由调用方提交并负责失效配置读缓存
+        """
+        _counts = super()._sync_namespace_rows(
+            db, CcConfigs, namespace, map(lambda _: {'namespace': namespace, **_}, rows))
+        if commit:
+            db.commit()
+            cls.invalidate_cache(namespace)
+        return _counts
+
+    @classmethod
+    def _read_statement(cls, namespace: Optional[str] = None, key: Optional[str] = None):
         statement = select(CcConfigs)
         if namespace is not None:
             statement = statement.where(CcConfigs.namespace == namespace)
         if key is not None:
             statement = statement.where(CcConfigs.key == key)
+        return statement
+
+    @classmethod
+    def _cache_result(
+            cls,
+            namespace: Optional[str],
+            key: Optional[str],
+            result: List[CcConfigs],
+            generation: int,
+            revision: Optional[int] = None
+    ):
+        """
+        :param revision: 查询前读取的 namespace 修订号，与结果一同缓存，数据不会早于该修订号
+        """
+        if namespace is not None:
+            # 缓存与 session 脱离关系的副本，避免缓存对象随 session 过期或被修改
+            cls._cache.set(
+                namespace,
+                key,
+                (revision, tuple(map(lambda _: CcConfigs.model_validate(_), result))),
+                generation=generation
+            )
+
+    @classmethod
+    def _lookup_cache(cls, namespace: Optional[str], key: Optional[str], revision: Optional[int]) -> tuple:
+        """
+        :param revision: 指定时，缓存的修订号与之不一致视为未命中，缓存数据可能早于该修订号
+        :return: 缓存命中的结果（未命中时为 MISSING）、查询前的缓存代数
+        """
+        if namespace is None:
+            return MISSING, 0
+        _cached = cls._cache.get(namespace, key)
+        if _cached is not MISSING and (revision is None or _cached[0] == revision):
+            return list(_cached[1]), 0
+        return MISSING, cls._cache.generation(namespace)
+
+    @classmethod
+    def read_by_primary(
+            cls,
+            db: Session,
+            namespace: Optional[str] = None,
+            key: Optional[str] = None,
+            revision: Optional[int] = None
+    ) -> List[CcConfigs]:
+        """
+        :param revision: 调用方已读取的 namespace 修订号（如用于 ETag），返回的数据不会早于该修订号
+        """
+        # 仅缓存指定了 namespace 的查询，未命中时记录代数，防止查询期间发生的写入被旧数据覆盖
+        _cached, _generation = cls._lookup_cache(namespace, key, revision)
+        if _cached is not MISSING:
+            return _cached
+
+        result = db.exec(cls._read_statement(namespace, key)).all()
+        if result:
+            cls._cache_result(namespace, key, result, _generation, revision)
+            return result
+        else:
+            raise CcDataNotFoundError
+
+    @classmethod
+    async def aread_by_primary(
+            cls,
+            db: Session | AsyncSession,
+            namespace: Optional[str] = None,
+            key: Optional[str] = None,
+            revision: Optional[int] = None
+    ) -> List[CcConfigs]:
+        """
+        read_by_primary 的异步版本，缓存命中时不访问数据库
+        """
+        _cached, _generation = cls._lookup_cache(namespace, key, revision)
+        if _cached is not MISSING:
+            return _cached
 
-        result = db.exec(statement).all()
+        result = await cls._aexec_all(db, cls._read_statement(namespace, key))
         if result:
+            cls._cache_result(namespace, key, result, _generation, revision)
             return result
         else:
             raise CcDataNotFoundError
 
     @classmethod
-    def delete_all_namespace_rows(cls, db: Session, namespace: str) -> NoReturn:
-        super().delete(db, select(CcConfigs).where(CcConfigs.namespace == namespace))
+    def _read_keys_statements(cls, namespace: str, keys: List[str]):
+        for _i in range(0, len(keys), 1000):
+            yield select(CcConfigs).where(CcConfigs.namespace == namespace).where(CcConfigs.key.in_(keys[_i:_i + 1000]))
+
+    @classmethod
+    def _lookup_keys_cache(cls, namespace: str, keys: Iterable[str]) -> tuple:
+        """
+        :return: 缓存命中的配置字典、未命中的配置键列表、查询前的缓存代数
+        """
+        _generation = cls._cache.generation(namespace)
+        _found, _missed = {}, []
+        for _k in dict.fromkeys(keys):
+            _cached = cls._cache.get(namespace, _k)
+            if _cached is MISSING:
+                _missed.append(_k)
+            else:
+                _found[_k] = _cached[1][0]
+        return _found, _missed, _generation
+
+    @classmethod
+    def read_by_keys(cls, db: Session, namespace: str, keys: Iterable[str]) -> Dict[str, CcConfigs]:
+        """
+        批量读取 namespace 下的多个配置，缓存未命中的配置键合并为 IN 查询
+        :return: 配置键 -> 配置，不存在的配置键不在结果中
+        """
+        _found, _missed, _generation = cls._lookup_keys_cache(namespace, keys)
+        for statement in cls._read_keys_statements(namespace, _missed):
+            for _row in db.exec(statement).all():
+                _found[_row.key] = _row
+                cls._cache_result(namespace, _row.key, [_row], _generation)
+        return _found
+
+    @classmethod
+    async def aread_by_keys(cls, db: Session | AsyncSession, namespace: str, keys: Iterable[str]) -> Dict[str, CcConfigs]:
+        """
+        read_by_keys 的异步版本
+        """
+        _found, _missed, _generation = cls._lookup_keys_cache(namespace, keys)
+        for statement in cls._read_keys_statements(namespace, _missed):
+            for _row in await cls._aexec_all(db, statement):
+                _found[_row.key] = _row
+                cls._cache_result(namespace, _row.key, [_row], _generation)
+        return _found
+
+    @classmethod
+    def exists(cls, db: Session, namespace: str) -> bool:
+        return db.exec(select(CcConfigs.key).where(CcConfigs.namespace == namespace).limit(1)).first() is not None
+
+    @classmethod
+    def iter_namespace_rows(cls, db: Session, namespace: str, batch_size: int = 1000) -> Iterator[tuple]:
+        """
+        通过服务端游标逐批读取 namespace 下的全部配置，不构造 ORM 对象，内存占用与配置数量无关
+        :return: (key, value, description, category) 元组
+        """
+        _result = db.exec(
+            select(
+                CcConfigs.key, CcConfigs.value, CcConfigs.description, CcConfigs.category
+            ).where(
+                CcConfigs.namespace == namespace
+            ).order_by(
+                CcConfigs.key
+            ).execution_options(
+                stream_results=True,
+                yield_per=batch_size
+            )
+        )
+        try:
+            yield from _result
+        finally:
+            _result.close()
 
 
 class CrudCcNamespaces(Crud):
     @classmethod
-    def create(cls, db: Session, row: CcNamespaces) -> NoReturn:
-        super().create(db, [row])
+    def sync(cls, db: Session, namespace: str, version: str, commit: bool = True) -> NoReturn:
+        """
+        namespace 不存在则新增，存在且版本变化则更新版本
+        :param commit: 是否提交
+        """
+        row = db.get(CcNamespaces, namespace)
+        if row is None:
+            db.add(CcNamespaces(namespace=namespace, version=version))
+        elif row.version != version:
+            row.version = version
+            row.update_time = datetime.datetime.now()
+            db.add(row)
+        else:
+            return
+        cls._bump_revision(db, [namespace])
+        if commit:
+            db.commit()
+
+    @classmethod
+    def clone(cls, db: Session, source: str, target: str, commit: bool = True) -> int:
+        """
+        以 source 的版本新增 target
+        :param commit: 是否提交
+        :return: 复制的行数，source 不存在时为 0
+        """
+        _count = super()._clone_namespace_rows(
+            db, CcNamespaces, source, target, update_time=datetime.datetime.now())
+        if commit:
+            db.commit()
+        return _count
 
     @classmethod
-    def update(
+    def _read_statement(cls, namespace: Optional[str] = None):
+        statement = select(CcNamespaces)
+        if namespace:
+            statement = statement.where(CcNamespaces.namespace == namespace)
+        return statement
+
+    @classmethod
+    def read_by_primary(
             cls,
             db: Session,
-            namespace: str,
-            version: Optional[str] = None
-    ) -> CcNamespaces:
-        row = db.exec(select(CcNamespaces).where(CcNamespaces.namespace == namespace)).first()
-        if row:
-            is_change = 0
-            if version and row.version != version:
-                row.version = version
-                is_change += 1
-            if is_change:
-                row.update_time = datetime.datetime.now()
-                db.add(row)
-                db.commit()
-                db.refresh(row)
-            return row
+            namespace: Optional[str] = None,
+    ) -> List[CcNamespaces]:
+        result = db.exec(cls._read_statement(namespace)).all()
+        if result:
+            return result
         else:
             raise CcDataNotFoundError
 
     @classmethod
-    def read_by_primary(
+    async def aread_by_primary(
             cls,
-            db: Session,
+            db: Session | AsyncSession,
             namespace: Optional[str] = None,
     ) -> List[CcNamespaces]:
-        statement = select(CcNamespaces)
-        if namespace:
-            statement = statement.where(CcNamespaces.namespace == namespace)
-
-        result = db.exec(statement).all()
+        result = await cls._aexec_all(db, cls._read_statement(namespace))
         if result:
             return result
         else:
@@ -148,23 +578,69 @@ class CrudCcNamespaces(Crud):
 
 class CrudCcTemplates(Crud):
     @classmethod
-    def create(cls, db: Session, rows: List[CcTemplates], **render_envs):
-        rows = list(map(
-            lambda x: CcTemplates(
-                namespace=x.namespace,
-                template_name=x.template_name,
-                dest_address=cls._render_value(x.dest_address, **render_envs),
-                dest_path=cls._render_value(x.dest_path, **render_envs),
-                dest_user=cls._render_value(x.dest_user, **render_envs),
-                dest_passwd=cls._render_value(x.dest_passwd, **render_envs)
-            ),
-            rows
-        ))
-        super().create(db, rows)
+    def sync_namespace_rows(
+            cls,
+            db: Session,
+            namespace: str,
+            rows: Iterable[CcTemplates],
+            commit: bool = True,
+            **render_envs
+    ) -> dict:
+        """
+        渲染并同步 namespace 下的全部模板信息，仅写入有变化的行
+        :param commit: 是否提交
+        """
+        _counts = super()._sync_namespace_rows(
+            db,
+            CcTemplates,
+            namespace,
+            map(
+                lambda x: {
+                    'namespace': namespace,
+                    'template_name': x.template_name,
+                    'dest_address': cls._render_value(x.dest_address, **render_envs),
+                    'dest_path': cls._render_value(x.dest_path, **render_envs),
+                    'dest_user': cls._render_value(x.dest_user, **render_envs),
+                    'dest_passwd': cls._render_value(x.dest_passwd, **render_envs)
+                },
+                rows
+            )
+        )
+        if commit:
+            db.commit()
+        return _counts
+
+    @classmethod
+    def update_dest_infos(cls, db: Session, namespace: str, rows: List[dict], commit: bool = True) -> NoReturn:
+        """
+        批量更新 namespace 下多个模板的目标信息（已渲染）
+        :param rows: 每行包含 template_name 及需要更新的目标信息字段
+        :param commit: 是否提交
+        """
+        super()._update_namespace_rows(db, CcTemplates, namespace, rows)
+        if commit:
+            db.commit()
 
     @classmethod
-    def delete_all_namespace_rows(cls, db: Session, namespace: str) -> NoReturn:
-        super().delete(db, select(CcTemplates).where(CcTemplates.namespace == namespace))
+    def clone_namespace_rows(cls, db: Session, source: str, target: str, commit: bool = True) -> int:
+        """
+        将 source 下的全部模板信息复制到 target，目标信息不重新渲染
+        :param commit: 是否提交
+        :return: 复制的行数
+        """
+        _count = super()._clone_namespace_rows(db, CcTemplates, source, target)
+        if commit:
+            db.commit()
+        return _count
+
+    @classmethod
+    def _read_statement(cls, namespace: Optional[str] = None, template_name: Optional[str] = None):
+        statement = select(CcTemplates)
+        if namespace is not None:
+            statement = statement.where(CcTemplates.namespace == namespace)
+        if template_name is not None:
+            statement = statement.where(CcTemplates.template_name == template_name)
+        return statement
 
     @classmethod
     def read_by_primary(
@@ -173,13 +649,16 @@ class CrudCcTemplates(Crud):
             namespace: Optional[str] = None,
             template_name: Optional[str] = None
     ) -> List[CcTemplates]:
-        statement = select(CcTemplates)
-        if namespace is not None:
-            statement = statement.where(CcTemplates.namespace == namespace)
-        if template_name is not None:
-            statement = statement.where(CcTemplates.template_name == template_name)
+        return db.exec(cls._read_statement(namespace, template_name)).all()
 
-        return db.exec(statement).all()
+    @classmethod
+    async def aread_by_primary(
+            cls,
+            db: Session | AsyncSession,
+            namespace: Optional[str] = None,
+            template_name: Optional[str] = None
+    ) -> List[CcTemplates]:
+        return await cls._aexec_all(db, cls._read_statement(namespace, template_name))
 
     @classmethod
     def update_dest_info(
@@ -199,13 +678,410 @@ class CrudCcTemplates(Crud):
         ).first()
 
         if row:
-            row.dest_address = cls._render_value(new_row.dest_address, **render_envs),
-            row.dest_path = cls._render_value(new_row.dest_path, **render_envs),
-            row.dest_user = cls._render_value(new_row.dest_user, **render_envs),
+            row.dest_address = cls._render_value(new_row.dest_address, **render_envs)
+            row.dest_path = cls._render_value(new_row.dest_path, **render_envs)
+            row.dest_user = cls._render_value(new_row.dest_user, **render_envs)
             row.dest_passwd = cls._render_value(new_row.dest_passwd, **render_envs)
             db.add(row)
+            cls._bump_revision(db, [new_row.namespace])
             db.commit()
             db.refresh(row)
             return row
         else:
             raise CcDataNotFoundError
+
+
+class CrudCcRevisions(Crud):
+    # 本进程已知的 namespace 修订号：本进程提交写操作后及 RevisionWatcher 轮询时更新，读请求据此生成 ETag、校验读缓存，无需查库
+    _known: Dict[str, int] = {}
+    _known_lock = threading.Lock()
+
+    @classmethod
+    def remember(cls, revisions: Dict[str, int]) -> NoReturn:
+        """
+        更新本进程已知的修订号，修订号只增不减，并发更新时保留较大者
+        """
+        with cls._known_lock:
+            for _ns, _r in revisions.items():
+                if _r > cls._known.get(_ns, 0):
+                    cls._known[_ns] = _r
+
+    @classmethod
+    async def aread_known_revision(cls, db: Session | AsyncSession, namespace: str) -> int:
+        """
+        :return: 本进程已知的修订号，未知时查库；修订号为 0（namespace 不存在）时不记录，避免任意 namespace 占用内存
+        """
+        _revision = cls._known.get(namespace)
+        if _revision is None:
+            _revision = await cls.aread_revision(db, namespace)
+            cls.remember({namespace: _revision})
+        return _revision
+
+    @classmethod
+    def read_revision(cls, db: Session, namespace: str) -> int:
+        """
+        :return: namespace 当前的修订号，namespace 从未发生过写操作时返回 0
+        """
+        row = db.get(CcRevisions, namespace)
+        return row.revision if row else 0
+
+    @classmethod
+    async def aread_revision(cls, db: Session | AsyncSession, namespace: str) -> int:
+        row = await cls._aget(db, CcRevisions, namespace)
+        return row.revision if row else 0
+
+    @classmethod
+    def read_revisions(cls, db: Session) -> Dict[str, int]:
+        """
+        :return: namespace -> 当前的修订号
+        """
+        return dict(db.exec(sa_select(CcRevisions.namespace, CcRevisions.revision)).all())
+
+
+class CrudCcConfigHistory(Crud):
+    @classmethod
+    def _current_revision(cls, db: Session, namespace: str) -> int:
+        # 不经过 session 的对象缓存，读取本事务中 _bump_revision 递增后的修订号
+        return db.exec(
+            sa_select(CcRevisions.revision).where(CcRevisions.namespace == namespace)
+        ).scalar_one_or_none() or 0
+
+    @classmethod
+    def record(cls, db: Session, changes: Iterable[Tuple[Optional[dict], Optional[dict]]]) -> NoReturn:
+        """
+        按 namespace 当前的修订号写入配置值的变更记录，不提交；配置值未变化的更新（如仅描述变化）不记录
+        :param changes: (变更前的行, 变更后的行)，新增时变更前为 None，删除时变更后为 None
+        """
+        _now = datetime.datetime.now()
+        _revisions = {}
+        _rows = []
+        for _old, _new in changes:
+            if _old is not None and _new is not None and _old['value'] == _new['value']:
+                continue
+            _row = _old if _new is None else _new
+            if _row['namespace'] not in _revisions:
+                _revisions[_row['namespace']] = cls._current_revision(db, _row['namespace'])
+            _rows.append({
+                'namespace': _row['namespace'],
+                'revision': _revisions[_row['namespace']],
+                'key': _row['key'],
+                'change': 'insert' if _old is None else 'delete' if _new is None else 'update',
+                'old_value': None if _old is None else _old['value'],
+                'new_value': None if _new is None else _new['value'],
+                'description': _old['description'] if _new is None else None,
+                'category': _old['category'] if _new is None else None,
+                'change_time': _now
+            })
+        if _rows:
+            db.exec(insert(CcConfigHistory), params=_rows)
+
+    @classmethod
+    def record_clone(cls, db: Session, source: str, target: str) -> NoReturn:
+        """
+        以 INSERT ... SELECT 为复制到 target 的全部配置写入新增记录，不提交
+        """
+        db.exec(
+            insert(CcConfigHistory).from_select(
+                ['namespace', 'revision', 'key', 'change', 'new_value', 'change_time'],
+                sa_select(
+                    literal(target),
+                    literal(cls._current_revision(db, target)),
+                    CcConfigs.key,
+                    literal('insert'),
+                    CcConfigs.value,
+                    literal(datetime.datetime.now())
+                ).where(
+                    CcConfigs.namespace == source
+                )
+            )
+        )
+
+    @classmethod
+    def read_history(
+            cls,
+            db: Session,
+            namespace: str,
+            key: Optional[str] = None,
+            since_revision: Optional[int] = None,
+            limit: int = 100
+    ) -> List[CcConfigHistory]:
+        """
+        :param since_revision: 仅返回该修订号之后的变更
+        :return: 变更记录，最近的变更在前
+        """
+        statement = select(CcConfigHistory).where(CcConfigHistory.namespace == namespace)
+        if key is not None:
+            statement = statement.where(CcConfigHistory.key == key)
+        if since_revision is not None:
+            statement = statement.where(CcConfigHistory.revision > since_revision)
+        return db.exec(statement.order_by(CcConfigHistory.id.desc()).limit(limit)).all()
+
+    @classmethod
+    def read_earliest_revision(cls, db: Session, namespace: str) -> Optional[int]:
+        """
+        :return: 可回溯的最早修订号，即第一条变更记录之前的修订号；没有变更记录时返回 None
+        """
+        _revision = db.exec(
+            sa_select(func.min(CcConfigHistory.revision)).where(CcConfigHistory.namespace == namespace)
+        ).scalar_one()
+        return None if _revision is None else _revision - 1
+
+    @classmethod
+    def read_revision_at(cls, db: Session, namespace: str, timestamp: datetime.datetime) -> Optional[int]:
+        """
+        :return: 指定时间点及之前最后一次配置变更后的修订号，该时间点之前没有变更记录时返回 None
+        """
+        return db.exec(
+            sa_select(
+                func.max(CcConfigHistory.revision)
+            ).where(
+                CcConfigHistory.namespace == namespace
+            ).where(
+                CcConfigHistory.change_time <= timestamp
+            )
+        ).scalar_one()
+
+    @classmethod
+    def iter_changes_after(cls, db: Session, namespace: str, revision: int, batch_size: int = 1000) -> Iterator[tuple]:
+        """
+        按变更的逆序逐批读取指定修订号之后的变更记录，不构造 ORM 对象
+        :return: (key, change, old_value, description, category) 元组
+        """
+        _result = db.exec(
+            sa_select(
+                CcConfigHistory.key,
+                CcConfigHistory.change,
+                CcConfigHistory.old_value,
+                CcConfigHistory.description,
+                CcConfigHistory.category
+            ).where(
+                CcConfigHistory.namespace == namespace
+            ).where(
+                CcConfigHistory.revision > revision
+            ).order_by(
+                CcConfigHistory.id.desc()
+            ).execution_options(
+                stream_results=True,
+                yield_per=batch_size
+            )
+        )
+        try:
+            yield from _result
+        finally:
+            _result.close()
+
+
+class CrudCcDeployRecords(Crud):
+    @classmethod
+    def read_hashes(cls, db: Session, namespace: str, template_name: Optional[str] = None) -> Dict[str, str]:
+        """
+        :return: 模板名称 -> 最近一次发布成功的内容摘要
+        """
+        statement = select(CcDeployRecords).where(CcDeployRecords.namespace == namespace)
+        if template_name is not None:
+            statement = statement.where(CcDeployRecords.template_name == template_name)
+        return {_.template_name: _.content_hash for _ in db.exec(statement).all()}
+
+    @classmethod
+    def record(cls, db: Session, namespace: str, content_hashes: Dict[str, str]) -> NoReturn:
+        """
+        :param content_hashes: 模板名称 -> 本次发布成功的内容摘要
+        """
+        if not content_hashes:
+            return
+        for _name, _hash in content_hashes.items():
+            row = db.get(CcDeployRecords, (namespace, _name))
+            if row is None:
+                row = CcDeployRecords(namespace=namespace, template_name=_name, content_hash=_hash)
+            else:
+                row.content_hash = _hash
+                row.deploy_time = datetime.datetime.now()
+            db.add(row)
+        db.commit()
+
+
+class CrudCcJobs(Crud):
+    @classmethod
+    def read_by_primary(cls, db: Session, job_id: str) -> CcJobs:
+        row = db.get(CcJobs, job_id)
+        if row is None:
+            raise CcDataNotFoundError
+        return row
+
+    @classmethod
+    def read_jobs(
+            cls,
+            db: Session,
+            namespace: Optional[str] = None,
+            status: Optional[str] = None,
+            limit: int = 100
+    ) -> List[CcJobs]:
+        """
+        :return: 按提交时间倒序排列的任务
+        """
+        statement = select(CcJobs)
+        if namespace is not None:
+            statement = statement.where(CcJobs.namespace == namespace)
+        if status is not None:
+            statement = statement.where(CcJobs.status == status)
+        return list(db.exec(statement.order_by(CcJobs.submit_time.desc()).limit(limit)).all())
+
+    @classmethod
+    def read_queued_ids(cls, db: Session, submitted_before: Optional[datetime.datetime] = None) -> List[str]:
+        """
+        :param submitted_before: 只读取在此时间之前提交的任务
+        :return: 按提交时间排列的排队中任务的 ID
+        """
+        statement = select(CcJobs.job_id).where(CcJobs.status == 'queued')
+        if submitted_before is not None:
+            statement = statement.where(CcJobs.submit_time < submitted_before)
+        return list(db.exec(statement.order_by(CcJobs.submit_time)).all())
+
+    @classmethod
+    def renew_leases(cls, db: Session, owner: str, job_ids: Iterable[str], lease_expire_time: datetime.datetime) -> int:
+        """
+        续约持有进程为 owner 的执行中任务
+        :return: 续约的任务数
+        """
+        _job_ids = list(job_ids)
+        if not _job_ids:
+            return 0
+        result = db.exec(
+            update(CcJobs).where(
+                CcJobs.job_id.in_(_job_ids)
+            ).where(
+                CcJobs.owner == owner
+            ).where(
+                CcJobs.status == 'running'
+            ).values(
+                lease_expire_time=lease_expire_time
+            )
+        )
+        db.commit()
+        return result.rowcount
+
+    @classmethod
+    def requeue_expired(cls, db: Session, now: datetime.datetime, log: str) -> List[str]:
+        """
+        将租约已过期（持有进程已退出）的执行中任务重新入队，多个进程同时处理同一个任务时只有一个成功
+        :param log: 追加到任务日志的内容
+        :return: 重新入队的任务 ID
+        """
+        _expired = db.exec(
+            select(CcJobs.job_id, CcJobs.lease_expire_time).where(
+                CcJobs.status == 'running'
+            ).where(
+                (CcJobs.lease_expire_time == None) | (CcJobs.lease_expire_time < now)  # noqa: E711
+            )
+        ).all()
+        _job_ids = []
+        for _job_id, _lease_expire_time in _expired:
+            # 以读取到的租约到期时间为条件，期间被续约或已被其他进程重新入队的任务不会重复处理
+            result = db.exec(
+                update(CcJobs).where(
+                    CcJobs.job_id == _job_id
+                ).where(
+                    CcJobs.status == 'running'
+                ).where(
+                    CcJobs.lease_expire_time == _lease_expire_time if _lease_expire_time is not None
+                    else CcJobs.lease_expire_time == None  # noqa: E711
+                ).values(
+                    status='queued',
+                    owner=None,
+                    lease_expire_time=None,
+                    logs=CcJobs.logs + log
+                )
+            )
+            if result.rowcount == 1:
+                _job_ids.append(_job_id)
+        db.commit()
+        return _job_ids
+
+    @classmethod
+    def update(cls, db: Session, job_id: str, **values) -> NoReturn:
+        db.exec(update(CcJobs).where(CcJobs.job_id == job_id).values(**values))
+        db.commit()
+
+    @classmethod
+    def claim(cls, db: Session, job_id: str, **values) -> bool:
+        """
+        将排队中的任务标记为执行中，多个进程同时领取同一个任务时只有一个成功
+        :return: 是否领取成功
+        """
+        result = db.exec(
+            update(CcJobs).where(CcJobs.job_id == job_id).where(CcJobs.status == 'queued').values(
+                status='running', **values)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+    @classmethod
+    def delete_finished_before(cls, db: Session, finish_time: datetime.datetime) -> int:
+        result = db.exec(
+            delete(CcJobs).where(CcJobs.status.in_(('done', 'failed'))).where(CcJobs.finish_time < finish_time)
+        )
+        db.commit()
+        return result.rowcount
+
+
+class CrudCcRegistryFingerprints(Crud):
+    @classmethod
+    def read_by_primary(cls, db: Session, namespace: str) -> Optional[CcRegistryFingerprints]:
+        return db.get(CcRegistryFingerprints, namespace)
+
+    @classmethod
+    def save(cls, db: Session, namespace: str, fingerprint: str, version: str, revision: int) -> NoReturn:
+        row = db.get(CcRegistryFingerprints, namespace)
+        if row is None:
+            row = CcRegistryFingerprints(namespace=namespace, fingerprint=fingerprint, version=version, revision=revision)
+        else:
+            row.fingerprint = fingerprint
+            row.version = version
+            row.revision = revision
+            row.update_time = datetime.datetime.now()
+        db.add(row)
+        db.commit()
+
+
+class CrudCcLocks(Crud):
+    @classmethod
+    def acquire(cls, db: Session, name: str, owner: str, timeout: float) -> bool:
+        """
+        获取数据库锁：锁未被持有或已过期时获取成功
+        :param owner: 持有者标识，释放时需一致
+        :param timeout: 锁的有效期，单位：秒
+        """
+        _now = datetime.datetime.now()
+        if db.get(CcLocks, name) is None:
+            try:
+                db.add(CcLocks(name=name))
+                db.commit()
+            except IntegrityError:
+                # 其他进程已创建
+                db.rollback()
+        result = db.exec(
+            update(CcLocks).where(CcLocks.name == name).where(
+                (CcLocks.owner == None) | (CcLocks.expire_time < _now)  # noqa: E711
+            ).values(owner=owner, expire_time=_now + datetime.timedelta(seconds=timeout))
+        )
+        db.commit()
+        return result.rowcount == 1
+
+    @classmethod
+    def release(cls, db: Session, name: str, owner: str, finished: bool = True) -> NoReturn:
+        """
+        :param finished: 持有期间的操作是否执行完成，完成时记录完成时间
+        """
+        _values = {'owner': None, 'expire_time': None}
+        if finished:
+            _values['finish_time'] = datetime.datetime.now()
+        db.exec(update(CcLocks).where(CcLocks.name == name).where(CcLocks.owner == owner).values(**_values))
+        db.commit()
+
+    @classmethod
+    def read_finish_time(cls, db: Session, name: str) -> Optional[datetime.datetime]:
+        row = db.get(CcLocks, name)
+        if row is None:
+            return None
+        db.refresh(row)
+        return row.finish_time
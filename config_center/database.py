@@ -0,0 +1,126 @@
+from urllib.parse import quote_plus
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url, Engine
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import ini
+from utils import metrics
+
+
+# 同步驱动与异步驱动的对应关系，用于由同步连接串推导异步连接串
+async_drivers = {
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+}
+# sqlite 模式下每个连接建立时执行的 pragma：WAL 模式允许读写并发，NORMAL 同步级别在 WAL 下仍可保证一致性
+sqlite_pragmas = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA cache_size=-20000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA foreign_keys=ON',
+)
+
+
+def get_db_url() -> str:
+    if ini.db_url != 'auto':
+        return ini.db_url
+    return f"mysql+pymysql://{ini.db_user}:{quote_plus(ini.db_pass)}@{ini.db_host}:{ini.db_port}/{ini.db_name}"
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def is_sqlite_memory(url: str) -> bool:
+    return is_sqlite(url) and make_url(url).database in (None, '', ':memory:')
+
+
+def get_async_db_url(db_url: str) -> str:
+    if ini.db_async_url != 'auto':
+        return ini.db_async_url
+    _url = make_url(db_url)
+    return _url.set(drivername=async_drivers.get(_url.drivername, _url.drivername)).render_as_string(
+        hide_password=False)
+
+
+def get_pool_args(url: str) -> dict:
+    """
+    连接池参数；sqlite 使用 sqlalchemy 默认的连接池（不支持 pool_size 等参数），仅保留连接检查
+    """
+    if is_sqlite_memory(url):
+        # 内存数据库仅存在于单个连接中，所有线程共用同一个连接
+        return {'poolclass': StaticPool}
+    if is_sqlite(url):
+        return {'pool_pre_ping': ini.db_pool_pre_ping.lower() == 'true'}
+    return {
+        'pool_size': int(ini.db_pool_size),
+        'max_overflow': int(ini.db_max_overflow),
+        'pool_recycle': int(ini.db_pool_recycle),
+        'pool_timeout': int(ini.db_pool_timeout),
+        'pool_pre_ping': ini.db_pool_pre_ping.lower() == 'true',
+    }
+
+
+def get_connect_args(url: str) -> dict:
+    if is_sqlite(url):
+        # 连接由连接池在多个线程间复用
+        return {'check_same_thread': False, **ini.connect_args}
+    return ini.connect_args
+
+
+def set_sqlite_pragmas(sync_engine: Engine) -> None:
+    @event.listens_for(sync_engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        _cursor = dbapi_connection.cursor()
+        for _pragma in sqlite_pragmas:
+            _cursor.execute(_pragma)
+        _cursor.close()
+
+
+db_url = get_db_url()
+engine = create_engine(
+    db_url,
+    echo=True if ini.log_level.lower() == 'debug' else False,
+    echo_pool=False,
+    connect_args=get_connect_args(db_url),
+    **get_pool_args(db_url)
+)
+if is_sqlite(db_url):
+    set_sqlite_pragmas(engine)
+metrics.instrument_engine(engine)
+# 异步引擎，仅在开启异步模式时创建，读接口通过它在事件循环中访问数据库，不占用线程池；
+# sqlite 内存数据库无法在同步、异步两个引擎间共享，此时不创建异步引擎
+async_db_url = get_async_db_url(db_url)
+async_engine = create_async_engine(
+    async_db_url,
+    echo=True if ini.log_level.lower() == 'debug' else False,
+    **get_pool_args(async_db_url)
+) if ini.db_async_enabled.lower() == 'true' and not is_sqlite_memory(db_url) else None
+if async_engine is not None:
+    if is_sqlite(async_db_url):
+        set_sqlite_pragmas(async_engine.sync_engine)
+    metrics.instrument_engine(async_engine.sync_engine)
+
+
+def get_session():
+    with Session(engine) as session:
+        yield session
+
+
+async def get_read_session():
+    """
+    读接口使用的 session：开启异步模式时为 AsyncSession，否则为同步 Session（crud 的异步读方法会将其放到线程中执行）
+    """
+    if async_engine is not None:
+        async with AsyncSession(async_engine) as session:
+            yield session
+    else:
+        with Session(engine) as session:
+            yield session
@@ -18,6 +18,10 @@ class CcDataDeleteError(CcDataError):
     pass
 
 
+class CcDataConflictError(CcDataError):
+    pass
+
+
 class CcResourcesError(CcError):
     pass
 
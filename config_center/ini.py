@@ -34,6 +34,10 @@ def get_all_configs() -> dict:
 # 本地运行全部走默认值获取配置
 # API 服务端口
 api_port = get_ini('API_PORT', '9791')
+# API 服务的工作进程数，多进程间通过数据库锁保证启动注册只执行一次，通过轮询修订号保持读缓存一致
+api_workers = get_ini('API_WORKERS', '1')
+# 数据库连接串（sqlalchemy 格式），例如 sqlite:////data/cc.db，auto 表示使用下面的 mysql 配置拼接
+db_url = get_ini('DB_URL', 'auto')
 # 数据库节点
 db_host = get_ini('DB_HOST', '10.45.186.149')
 # 数据库端口
@@ -44,6 +48,20 @@ db_name = get_ini('DB_NAME', 'cc')
 db_user = get_ini('DB_USER', 'snow')
 # 数据库密码
 db_pass = get_ini('DB_PASS', 'snow@Sec123')
+# 数据库连接池大小
+db_pool_size = get_ini('DB_POOL_SIZE', '10')
+# 数据库连接池允许超出 pool_size 的连接数
+db_max_overflow = get_ini('DB_MAX_OVERFLOW', '20')
+# 数据库连接的回收时长，单位：秒，需小于数据库服务端的 wait_timeout
+db_pool_recycle = get_ini('DB_POOL_RECYCLE', '3600')
+# 从数据库连接池获取连接的超时时间，单位：秒
+db_pool_timeout = get_ini('DB_POOL_TIMEOUT', '30')
+# 从数据库连接池取出连接时是否检查连接可用性：true/false
+db_pool_pre_ping = get_ini('DB_POOL_PRE_PING', 'true')
+# 读接口是否使用异步数据库驱动（mysql 为 aiomysql，sqlite 为 aiosqlite）：true/false
+db_async_enabled = get_ini('DB_ASYNC_ENABLED', 'false')
+# 异步数据库连接串，auto 表示由同步连接串推导
+db_async_url = get_ini('DB_ASYNC_URL', 'auto')
 # cc 运行基路径
 cc_work_path = get_ini('CC_WORK_PATH', './')
 # 日志级别
@@ -52,6 +70,42 @@ log_level = get_ini('LOG_LEVEL', 'debug')
 snow_namespace = get_ini('SNOW_NAMESPACE', 'snow')
 # 资源库基目录
 resources_path = get_ini('RESOURCES_PATH', os.path.join(config_center_path, 'resources'))
+# 配置读缓存的条目上限，设置为 0 则关闭缓存
+config_cache_max_size = get_ini('CONFIG_CACHE_MAX_SIZE', '10000')
+# 配置读缓存的有效期，单位：秒
+config_cache_ttl = get_ini('CONFIG_CACHE_TTL', '60')
+# 批量读取配置接口单次请求允许的最大配置数
+config_batch_max_items = get_ini('CONFIG_BATCH_MAX_ITEMS', '1000')
+# 批量发布模板时的最大并发数
+deploy_max_workers = get_ini('DEPLOY_MAX_WORKERS', '8')
+# 单个目标节点的 SSH 连接数上限
+ssh_pool_max_per_host = get_ini('SSH_POOL_MAX_PER_HOST', '4')
+# SSH 空闲连接的保留时长，单位：秒
+ssh_pool_idle_timeout = get_ini('SSH_POOL_IDLE_TIMEOUT', '300')
+# SSH 建立连接的超时时间，单位：秒
+ssh_connect_timeout = get_ini('SSH_CONNECT_TIMEOUT', '10')
+# SSH 连接数达到上限时等待空闲连接的超时时间，单位：秒
+ssh_pool_acquire_timeout = get_ini('SSH_POOL_ACQUIRE_TIMEOUT', '60')
+# 模板发布的文件传输方式：shell（echo 原地写入）或 sftp（分块流式传输，目录可写时原子替换，需显式开启）
+file_transfer_mode = get_ini('FILE_TRANSFER_MODE', 'shell')
+# sftp 传输方式下每次写入的字节数
+file_transfer_chunk_size = get_ini('FILE_TRANSFER_CHUNK_SIZE', '32768')
+# 已编译 jinja 模板的缓存条目上限
+jinja_cache_max_size = get_ini('JINJA_CACHE_MAX_SIZE', '2048')
+# 模板文件编译结果（字节码）的磁盘缓存目录
+jinja_bytecode_cache_path = get_ini('JINJA_BYTECODE_CACHE_PATH', os.path.join(config_center_path, '.jinja_cache'))
+# 后台任务（模板发布、配置变更后的重新渲染）的并发数
+job_max_workers = get_ini('JOB_MAX_WORKERS', '2')
+# 已结束后台任务的保留天数，服务启动时清理过期的任务记录
+job_retention_days = get_ini('JOB_RETENTION_DAYS', '7')
+# 执行中任务的租约时长，单位：秒，执行进程每隔三分之一租约时长续约一次，租约过期的任务由其他进程重新入队执行
+job_lease_timeout = get_ini('JOB_LEASE_TIMEOUT', '60')
+# 监控指标中 namespace、template 标签各自允许的取值数量上限，超出后新出现的取值统一记为 other
+metrics_max_label_values = get_ini('METRICS_MAX_LABEL_VALUES', '200')
+# 启动锁的超时时间，单位：秒，持有锁的进程异常退出时，超时后其他进程可重新获取
+startup_lock_timeout = get_ini('STARTUP_LOCK_TIMEOUT', '300')
+# 轮询修订号、失效其他进程写入的 namespace 读缓存的间隔，单位：秒，设置为 0 则不轮询（仅适用于单进程部署，ETag 仅随本进程的写入变化）
+cache_sync_interval = get_ini('CACHE_SYNC_INTERVAL', '1')
 
 # ============== 不暴露出去的默认配置 ==============
 # 数据库连接参数
@@ -0,0 +1,270 @@
+import os
+import json
+import uuid
+import time
+import socket
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NoReturn
+from sqlmodel import Session
+
+import ini
+from models import CcJobs, CcJob, CcDeployResult
+from crud import CrudCcJobs
+from database import engine
+
+
+class JobManager:
+    """
+    后台任务队列：任务记录持久化到 cc_jobs 表，在有界线程池中执行，每个任务使用独立的 session
+
+    - 提交时即写入任务记录并返回任务 ID，状态、各模板的发布结果及耗时、执行日志均可查询
+    - 多进程部署时，任务执行前以条件更新领取，同一个任务只会被一个进程执行；执行中的任务记录持有进程及租约到期时间，
+      持有进程定时续约
+    - 持有进程退出（如服务重启）后租约过期，任务由存活的进程重新入队执行；发布按内容摘要跳过未变化的模板，重复执行是安全的
+    - 提交进程未领取就已退出的任务，排队超过租约时长后由存活的进程领取执行
+    """
+    def __init__(self, max_workers: int, retention_days: float, lease_timeout: float):
+        """
+        :param max_workers: 同时执行的任务数上限
+        :param retention_days: 已结束任务的保留天数
+        :param lease_timeout: 执行中任务的租约时长，单位：秒
+        """
+        self._max_workers = max_workers
+        self._retention_days = retention_days
+        self._lease_timeout = lease_timeout
+        self._owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+        # 本进程执行中的任务
+        self._running: set = set()
+        # 已提交到本进程线程池、尚未执行结束的任务，避免重复提交
+        self._submitted: set = set()
+        self._running_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._heartbeat: threading.Thread | None = None
+        # 任务类型 -> 任务函数，第一个参数为任务专用的 session，其余参数为任务参数
+        self._handlers: Dict[str, Callable[..., CcDeployResult | List[CcDeployResult]]] = {}
+
+    def register(self, kind: str, handler: Callable[..., CcDeployResult | List[CcDeployResult]]) -> NoReturn:
+        self._handlers[kind] = handler
+
+    def submit(self, kind: str, namespace: str, payload: dict) -> CcJob:
+        """
+        :param namespace: 任务所属的 namespace，用于查询
+        :param payload: 任务函数的参数，需可 json 序列化，服务重启后以相同参数重新执行
+        """
+        if kind not in self._handlers:
+            raise KeyError(f'Unknown job kind: {kind}')
+        job = CcJobs(job_id=uuid.uuid4().hex, kind=kind, namespace=namespace, payload=json.dumps(payload))
+        with Session(engine) as session:
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            _job = self.to_job(job)
+        self._submit(_job.job_id)
+        return _job
+
+    def recover(self) -> int:
+        """
+        服务启动时调用：清理过期的任务记录，将租约已过期的执行中任务重新入队，并执行全部排队中的任务
+        :return: 执行的任务数
+        """
+        with Session(engine) as session:
+            CrudCcJobs.delete_finished_before(session, datetime.now() - timedelta(days=self._retention_days))
+            CrudCcJobs.requeue_expired(session, datetime.now(), self._log_line('lease expired, requeued'))
+            _job_ids = CrudCcJobs.read_queued_ids(session)
+        for _id in _job_ids:
+            self._submit(_id)
+        return len(_job_ids)
+
+    def start(self) -> NoReturn:
+        """
+        启动续约线程：定时续约本进程执行中的任务，将其他进程遗留的租约已过期的任务重新入队执行，并领取排队超时的任务
+        """
+        if self._heartbeat is not None:
+            return
+        self._stop_event.clear()
+        self._heartbeat = threading.Thread(target=self._run_heartbeat, name='cc-job-heartbeat', daemon=True)
+        self._heartbeat.start()
+
+    def heartbeat(self) -> List[str]:
+        """
+        :return: 提交到本进程执行的任务 ID：租约过期重新入队的任务，及排队超过租约时长的任务（提交进程可能已退出）
+        """
+        with self._running_lock:
+            _running = list(self._running)
+        with Session(engine) as session:
+            _now = datetime.now()
+            CrudCcJobs.renew_leases(
+                session, self._owner, _running, _now + timedelta(seconds=self._lease_timeout))
+            _job_ids = CrudCcJobs.requeue_expired(session, _now, self._log_line('lease expired, requeued'))
+            _job_ids += CrudCcJobs.read_queued_ids(session, _now - timedelta(seconds=self._lease_timeout))
+        return [_id for _id in dict.fromkeys(_job_ids) if self._submit(_id)]
+
+    def shutdown(self) -> NoReturn:
+        """
+        等待执行中的任务结束，尚未开始的任务保持排队状态，由其他进程或下次启动时执行
+        """
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+        # 执行中的任务结束后再停止续约
+        if self._heartbeat is not None:
+            self._stop_event.set()
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def _run_heartbeat(self) -> NoReturn:
+        while not self._stop_event.wait(self._lease_timeout / 3):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                # 数据库暂时不可用时等待下次续约
+                print(f'Job heartbeat failed: {type(e).__name__}: {e}')
+
+    @staticmethod
+    def to_job(row: CcJobs) -> CcJob:
+        return CcJob(
+            job_id=row.job_id,
+            kind=row.kind,
+            namespace=row.namespace,
+            status=row.status,
+            submit_time=row.submit_time,
+            start_time=row.start_time,
+            finish_time=row.finish_time,
+            attempts=row.attempts,
+            queue_duration=(row.start_time - row.submit_time).total_seconds() if row.start_time else None,
+            run_duration=(
+                (row.finish_time - row.start_time).total_seconds() if row.start_time and row.finish_time else None
+            ),
+            results=json.loads(row.results),
+            detail=row.detail
+        )
+
+    def _submit(self, job_id: str) -> bool:
+        """
+        :return: 是否提交，已提交到本进程且尚未执行结束的任务不重复提交
+        """
+        with self._running_lock:
+            if job_id in self._submitted:
+                return False
+            self._submitted.add(job_id)
+        self._get_executor().submit(self._run, job_id)
+        return True
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='cc-job')
+            return self._executor
+
+    @staticmethod
+    def _log_line(message: str) -> str:
+        return f'[{datetime.now().isoformat(sep=" ", timespec="milliseconds")}] {message}\n'
+
+    def _run(self, job_id: str) -> NoReturn:
+        try:
+            self._run_job(job_id)
+        finally:
+            with self._running_lock:
+                self._submitted.discard(job_id)
+
+    def _run_job(self, job_id: str) -> NoReturn:
+        with Session(engine) as session:
+            try:
+                job = CrudCcJobs.read_by_primary(session, job_id)
+            except Exception:
+                return
+            _logs = [job.logs]
+            _attempts = job.attempts + 1
+            _logs.append(self._log_line(f'start {job.kind} (namespace: {job.namespace}, attempt: {_attempts})'))
+            with self._running_lock:
+                self._running.add(job_id)
+            try:
+                if not CrudCcJobs.claim(
+                    session,
+                    job_id,
+                    start_time=datetime.now(),
+                    attempts=_attempts,
+                    logs=''.join(_logs),
+                    owner=self._owner,
+                    lease_expire_time=datetime.now() + timedelta(seconds=self._lease_timeout)
+                ):
+                    # 已被其他进程领取
+                    return
+                self._execute(session, job, _logs)
+            finally:
+                with self._running_lock:
+                    self._running.discard(job_id)
+
+    def _execute(self, session: Session, job: CcJobs, logs: List[str]) -> NoReturn:
+        """
+        :param logs: 已有的任务日志，执行日志追加在其后
+        """
+        job_id = job.job_id
+        _start = time.perf_counter()
+        try:
+            _results = self._handlers[job.kind](session, **json.loads(job.payload))
+        except Exception as e:
+            session.rollback()
+            logs.append(self._log_line(
+                f'failed after {time.perf_counter() - _start:.3f}s\n{traceback.format_exc()}'))
+            self._finish(
+                session,
+                job_id,
+                status='failed',
+                finish_time=datetime.now(),
+                detail=f'{type(e).__name__}: {e}',
+                logs=''.join(logs)
+            )
+            return
+
+        if isinstance(_results, CcDeployResult):
+            _results = [_results]
+        for _r in _results:
+            logs.append(self._log_line(
+                f'{_r.namespace}/{_r.template_name}: {_r.status} ({_r.duration:.3f}s)'
+                + (f' {_r.detail}' if _r.detail else '')
+            ))
+        _failed = sum(1 for _r in _results if _r.status == 'failed')
+        logs.append(self._log_line(
+            f'finished in {time.perf_counter() - _start:.3f}s, templates: {len(_results)}, failed: {_failed}'))
+        self._finish(
+            session,
+            job_id,
+            status='done',
+            finish_time=datetime.now(),
+            results=json.dumps([_r.model_dump() for _r in _results]),
+            detail=f'{_failed} of {len(_results)} templates failed' if _failed else '',
+            logs=''.join(logs)
+        )
+
+    @staticmethod
+    def _finish(session: Session, job_id: str, **values) -> NoReturn:
+        """
+        写入任务的最终状态；写入失败（如结果过大）时仍将任务标记为 failed，避免任务停留在 running，租约过期后被反复重新执行
+        """
+        try:
+            CrudCcJobs.update(session, job_id, **values)
+        except Exception as e:
+            session.rollback()
+            _detail = f'Saving job result failed: {type(e).__name__}: {e}'
+            print(_detail)
+            CrudCcJobs.update(
+                session,
+                job_id,
+                status='failed',
+                finish_time=values.get('finish_time', datetime.now()),
+                detail=_detail[:255]
+            )
+
+
+job_manager = JobManager(
+    max_workers=int(ini.job_max_workers),
+    retention_days=float(ini.job_retention_days),
+    lease_timeout=float(ini.job_lease_timeout)
+)
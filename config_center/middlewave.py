@@ -1,15 +1,49 @@
 import os
-from typing import NoReturn
+import re
+import json
+import time
+import zlib
+import shlex
+import shutil
+import difflib
+import uuid
+import socket
+import hashlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import NoReturn, List, Iterator, Tuple, Iterable, Dict, Callable
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session
 
 import ini
-from models import CcConfigs, CcTemplates, CcNamespaces, CcRegistryInfo
-from crud import CrudCcConfigs, CrudCcTemplates, CrudCcNamespaces
+from models import CcConfigs, CcTemplates, CcNamespaces, CcRegistryInfo, CcDeployResult
+from crud import (
+    Crud,
+    CrudCcConfigs,
+    CrudCcTemplates,
+    CrudCcNamespaces,
+    CrudCcConfigHistory,
+    CrudCcDeployRecords,
+    CrudCcLocks,
+    CrudCcRevisions,
+    CrudCcRegistryFingerprints
+)
 from utils.resources_handler import ResourcesHandle
+from utils.templates_lib_handler import TemplatesLibHandle, templates_meta_fields
 from utils.kv_content_analyzer import KVFileContentAnalyzer
-from utils.jinja_handler import JinjaHandler
 from utils.FileHandler import FileHandler
-from errors import CcDataNotFoundError, CcMetaIllegalError
+from utils.SSHConnectHandle import SSHConnectPool
+from utils import metrics
+from errors import CcDataNotFoundError, CcDataConflictError, CcMetaIllegalError, CcResourcesError
+
+
+# 进程级 SSH 连接池，多次发布到同一节点时复用已建立的连接
+ssh_pool = SSHConnectPool(
+    max_per_host=int(ini.ssh_pool_max_per_host),
+    idle_timeout=float(ini.ssh_pool_idle_timeout),
+    connect_timeout=float(ini.ssh_connect_timeout),
+    acquire_timeout=float(ini.ssh_pool_acquire_timeout)
+)
 
 
 def execute_wizard(db_session: Session, namespace) -> str:
@@ -28,7 +62,7 @@ def execute_wizard(db_session: Session, namespace) -> str:
     # 输出: 在meta但不在configs的配置项
     _in_meta_not_in_configs = []
     for _ in _cc_configs_meta:
-        if _['key'] not in _cc_configs_key_list:
+        if _.key not in _cc_configs_key_list:
             _in_meta_not_in_configs.append(_)
 
     # 校验：如果没有配置变化，则返回空字符串
@@ -41,9 +75,9 @@ def execute_wizard(db_session: Session, namespace) -> str:
     _annotation_dict = {}
     for _ in _pre_rows:
         # 如果 meta 表中的 level 字段值为 customized，则将此配置放入向导配置中
-        if _['level'] == 'customized':
-            _config_dict[_['key']] = ''
-            _annotation_dict[_['key']] = _['description']
+        if _.level == 'customized':
+            _config_dict[_.key] = ''
+            _annotation_dict[_.key] = _.description
 
     # 生成内容
     return KVFileContentAnalyzer.unparse(_config_dict, annotation_dict=_annotation_dict)
@@ -52,7 +86,7 @@ def execute_wizard(db_session: Session, namespace) -> str:
 def registry(
         db_session: Session,
         data: CcRegistryInfo
-) -> NoReturn:
+) -> dict:
     # 载入数据
     _wizard_configs = KVFileContentAnalyzer.parse(data.wizard_configs)
     _cc_configs_meta, _cc_templates_meta, _version = ResourcesHandle.get_library_data(data.namespace)
@@ -69,29 +103,29 @@ def registry(
     # 执行配置合并
     _result_configs = {}
     for _m in _cc_configs_meta:
-        if _m['level'] == 'default_overload':
-            _v = _m['value']
-        elif _m['level'] == 'customized':
+        if _m.level == 'default_overload':
+            _v = _m.value
+        elif _m.level == 'customized':
             try:
-                _v = _wizard_configs[_m['key']]
+                _v = _wizard_configs[_m.key]
             except KeyError:
                 try:
-                    _v = _cc_configs[_m['key']]
+                    _v = _cc_configs[_m.key]
                 except KeyError:
-                    _v = _m['value']
-        elif _m['level'] == 'default':
+                    _v = _m.value
+        elif _m.level == 'default':
             try:
-                _v = _cc_configs[_m['key']]
+                _v = _cc_configs[_m.key]
             except KeyError:
-                _v = _m['value']
+                _v = _m.value
         else:
-            raise CcMetaIllegalError(f'ERROR: 元数据中存在 level 字段值非法的数据：{_}')
-        _result_configs[_m['key']] = CcConfigs(
+            raise CcMetaIllegalError(f'ERROR: 元数据中存在 level 字段值非法的数据：{_m}')
+        _result_configs[_m.key] = CcConfigs(
             namespace=data.namespace,
-            key=_m['key'],
+            key=_m.key,
             value=_v,
-            description=_m['description'],
-            category=_m['category']
+            description=_m.description,
+            category=_m.category
         )
 
     # 生成项目配置环境变量，供渲染使用
@@ -120,62 +154,142 @@ def registry(
             'ini': ini.get_all_configs(),
         }
 
-    # 写入cc_configs
-    CrudCcConfigs.delete_all_namespace_rows(db_session, data.namespace)
-    CrudCcConfigs.create(
-        db_session,
-        _result_configs.values(),
-        **_render_envs
-    )
-
-    # 写入cc_templates
-    CrudCcTemplates.delete_all_namespace_rows(db_session, data.namespace)
-    for _ in _cc_templates_meta:
-        CrudCcTemplates.create(
+    # 在同一个事务中同步 cc_configs、cc_templates、cc_namespaces，仅写入有变化的行，注册过程中 namespace 的数据始终完整可读
+    try:
+        _configs_counts = CrudCcConfigs.sync_namespace_rows(
+            db_session,
+            data.namespace,
+            _result_configs.values(),
+            commit=False,
+            **_render_envs
+        )
+        _templates_counts = CrudCcTemplates.sync_namespace_rows(
             db_session,
-            [CcTemplates(
-                namespace=data.namespace,
-                template_name=_['template_name'],
-                dest_address=_['dest_address'],
-                dest_path=_['dest_path'],
-                dest_user=_['dest_user'],
-                dest_passwd=_['dest_passwd']
-            )],
+            data.namespace,
+            map(
+                lambda _: CcTemplates(
+                    namespace=data.namespace,
+                    template_name=_.template_name,
+                    dest_address=_.dest_address,
+                    dest_path=_.dest_path,
+                    dest_user=_.dest_user,
+                    dest_passwd=_.dest_passwd
+                ),
+                _cc_templates_meta
+            ),
+            commit=False,
             **_render_envs
         )
+        CrudCcNamespaces.sync(db_session, data.namespace, version=_version, commit=False)
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        # 提交后失效该 namespace 的配置读缓存，覆盖注册过程中被并发读取回填的数据
+        CrudCcConfigs.invalidate_cache(data.namespace)
+
+    _counts = {
+        'configs': _configs_counts,
+        'templates': _templates_counts
+    }
+    for _table, _table_counts in _counts.items():
+        for _change, _count in _table_counts.items():
+            metrics.registry_rows_total.labels(
+                namespace=metrics.namespace_label(data.namespace),
+                table=_table,
+                change=_change
+            ).inc(_count)
+    return _counts
+
 
-    # 更新 cc_namespaces 表
+def snow_resources_fingerprint() -> str:
+    """
+    snow 注册所用资源的内容摘要：namespace 目录下的全部文件（VERSION、元数据、wizard.conf）、模板文件列表及 ini 配置
+    """
+    _base = os.path.join(ini.resources_path, ini.snow_namespace)
+    _hash = hashlib.sha256()
+    with os.scandir(_base) as it:
+        _files = sorted((_e.name, _e.path) for _e in it if _e.is_file())
+    for _name, _path in _files:
+        _hash.update(_name.encode('utf-8') + b'\0')
+        with open(_path, mode='rb') as f:
+            _hash.update(f.read())
+        _hash.update(b'\0')
     try:
-        CrudCcNamespaces.update(db_session, data.namespace, version=_version)
-    except CcDataNotFoundError:
-        CrudCcNamespaces.create(db_session, CcNamespaces(namespace=data.namespace, version=_version))
+        _templates = sorted(os.listdir(os.path.join(_base, 'templates')))
+    except FileNotFoundError:
+        _templates = []
+    _hash.update(json.dumps(_templates).encode('utf-8'))
+    _hash.update(json.dumps(ini.get_all_configs(), sort_keys=True, default=str).encode('utf-8'))
+    return _hash.hexdigest()
+
 
+def init_snow_configs(db: Session, force: bool = False) -> dict | None:
+    """
+    注册 snow 自身配置；资源内容摘要与上次注册一致，且之后未通过接口修改过 snow 的数据时跳过注册
+    :param force: 忽略摘要，始终注册
+    :return: 各表同步的行数，跳过时返回 None
+    """
+    _fingerprint = snow_resources_fingerprint()
+    _record = CrudCcRegistryFingerprints.read_by_primary(db, ini.snow_namespace)
+    if (
+            not force
+            and _record is not None
+            and _record.fingerprint == _fingerprint
+            and _record.revision == CrudCcRevisions.read_revision(db, ini.snow_namespace)
+    ):
+        return None
 
-def init_snow_configs(db: Session):
     with open(os.path.join(ini.resources_path, ini.snow_namespace, 'wizard.conf'),
               mode='r', encoding='utf-8') as f:
         _w = f.read()
 
-    registry(db, CcRegistryInfo(namespace=ini.snow_namespace, wizard_configs=_w))
+    _counts = registry(db, CcRegistryInfo(namespace=ini.snow_namespace, wizard_configs=_w))
+    CrudCcRegistryFingerprints.save(
+        db,
+        ini.snow_namespace,
+        _fingerprint,
+        ResourcesHandle.get_library_data(ini.snow_namespace)[2],
+        CrudCcRevisions.read_revision(db, ini.snow_namespace)
+    )
+    return _counts
+
 
+def run_once_at_startup(db: Session, name: str, started_at: datetime, func: Callable[[], object]) -> bool:
+    """
+    多进程同时启动时，通过数据库锁保证启动操作只执行一次：获取到锁的进程执行，其他进程等待；
+    锁释放后，若最近一次执行完成的时间晚于本进程的启动时间，说明已由其他进程执行，直接跳过
+    :param name: 锁名称
+    :param started_at: 本进程的启动时间
+    :return: 是否由本进程执行
+    """
+    _owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    _timeout = float(ini.startup_lock_timeout)
+    while True:
+        _finish_time = CrudCcLocks.read_finish_time(db, name)
+        if _finish_time is not None and _finish_time >= started_at:
+            return False
+        if CrudCcLocks.acquire(db, name, _owner, _timeout):
+            break
+        time.sleep(0.5)
 
-def deploy_template(
-        db: Session,
-        namespace: str,
-        template_name: str
-) -> NoReturn:
-    # 读取模板及配置信息
+    _finished = False
     try:
-        template_info = CrudCcTemplates.read_by_primary(db=db, namespace=namespace, template_name=template_name)[0]
-        configs_info = CrudCcConfigs.read_by_primary(db=db, namespace=namespace)
-        snow_configs_info = CrudCcConfigs.read_by_primary(db=db, namespace=ini.snow_namespace)
-    except IndexError:
-        raise CcDataNotFoundError
+        func()
+        _finished = True
+    finally:
+        CrudCcLocks.release(db, name, _owner, finished=_finished)
+    return True
+
 
-    # 读取模板内容
-    _template_content = ResourcesHandle.get_template_content(namespace, template_name)
+def _load_render_envs(db: Session, namespace: str) -> dict:
+    """
+    读取自身配置及snow配置，转换为key=value形式，提供模板渲染使用
+    """
+    configs_info = CrudCcConfigs.read_by_primary(db=db, namespace=namespace)
+    snow_configs_info = CrudCcConfigs.read_by_primary(db=db, namespace=ini.snow_namespace)
 
-    # 生成中心配置，转换为key=value形式，提供渲染使用
     _center_configs = {
         'myself': {},
         'snow': {}
@@ -186,17 +300,546 @@ def deploy_template(
     # 载入snow配置
     for _ in snow_configs_info:
         _center_configs['snow'][_.key] = _.value
+    return _center_configs
 
-    # 渲染
-    _rendered_template = JinjaHandler.render(_template_content, **_center_configs)
 
-    # 发布
-    _file_handle = FileHandler(
+def _open_file_handle(template_info: CcTemplates) -> FileHandler:
+    return FileHandler(
         file_path=template_info.dest_path,
         host=template_info.dest_address.split(':')[0],
         ssh_port=template_info.dest_address.split(':')[1],
         username=template_info.dest_user,
-        password=template_info.dest_passwd
+        password=template_info.dest_passwd,
+        pool=ssh_pool,
+        transfer_mode=ini.file_transfer_mode,
+        chunk_size=int(ini.file_transfer_chunk_size)
     )
-    _file_handle.backup()
-    _file_handle.write(_rendered_template)
+
+
+def _publish(template_info: CcTemplates, rendered_template: str) -> NoReturn:
+    with _open_file_handle(template_info) as _file_handle:
+        _file_handle.backup()
+        _file_handle.write(rendered_template)
+
+
+def _diff(template_info: CcTemplates, rendered_template: str) -> str:
+    """
+    读取远端文件（一次读取），与发布后将写入的内容比对，返回 unified diff，内容无变化时返回空字符串；不备份、不写入
+    """
+    with _open_file_handle(template_info) as _file_handle:
+        _remote_content = _file_handle.read_raw()
+    # 发布时会在渲染结果末尾补一个换行符
+    _target = f'{template_info.dest_address}:{template_info.dest_path}'
+    return ''.join(difflib.unified_diff(
+        (_remote_content or '').splitlines(keepends=True),
+        f'{rendered_template}\n'.splitlines(keepends=True),
+        fromfile=_target if _remote_content is not None else '/dev/null',
+        tofile=f'{_target} (rendered)'
+    ))
+
+
+def _content_hash(template_info: CcTemplates, rendered_template: str) -> str:
+    """
+    发布内容摘要：目标地址、路径、用户任一变化都视为内容变化
+    """
+    _hash = hashlib.sha256()
+    for _ in (template_info.dest_address, template_info.dest_path, template_info.dest_user, rendered_template):
+        _hash.update(str(_).encode('utf-8'))
+        _hash.update(b'\0')
+    return _hash.hexdigest()
+
+
+def _deploy_one(
+        namespace: str,
+        template_info: CcTemplates,
+        render_envs: dict,
+        dry_run: bool = False,
+        force: bool = False,
+        deployed_hash: str | None = None
+) -> Tuple[CcDeployResult, str | None]:
+    """
+    渲染并发布（或比对）单个模板，不访问数据库，可在发布线程中执行
+    :param deployed_hash: 该模板上次发布成功的内容摘要
+    :return: 发布结果, 本次发布成功的内容摘要（未实际发布时为 None）
+    """
+    _start = time.perf_counter()
+    _rendered_template = ResourcesHandle.render_template(namespace, template_info.template_name, **render_envs)
+
+    if dry_run:
+        _diff_content = _diff(template_info, _rendered_template)
+        return CcDeployResult(
+            namespace=namespace,
+            template_name=template_info.template_name,
+            status='changed' if _diff_content else 'unchanged',
+            duration=time.perf_counter() - _start,
+            diff=_diff_content
+        ), None
+
+    _hash = _content_hash(template_info, _rendered_template)
+    if not force and _hash == deployed_hash:
+        return CcDeployResult(
+            namespace=namespace,
+            template_name=template_info.template_name,
+            status='skipped',
+            duration=time.perf_counter() - _start
+        ), None
+
+    _publish(template_info, _rendered_template)
+    return CcDeployResult(
+        namespace=namespace,
+        template_name=template_info.template_name,
+        status='ok',
+        duration=time.perf_counter() - _start
+    ), _hash
+
+
+def _record_deploy_metrics(result: CcDeployResult) -> NoReturn:
+    if result.status in ('changed', 'unchanged'):
+        # 仅比对（dry run）不计入发布结果
+        return
+    _labels = {
+        'namespace': metrics.namespace_label(result.namespace),
+        'template': metrics.template_label(result.template_name)
+    }
+    metrics.deploy_total.labels(status=result.status, **_labels).inc()
+    metrics.deploy_duration.labels(**_labels).observe(result.duration)
+
+
+def deploy_template(
+        db: Session,
+        namespace: str,
+        template_name: str,
+        dry_run: bool = False,
+        force: bool = False
+) -> CcDeployResult:
+    """
+    :param dry_run: 仅渲染并与远端文件比对，结果中返回 unified diff，不备份、不写入
+    :param force: 渲染结果与上次发布成功的内容一致时仍然发布
+    """
+    # 读取模板及配置信息
+    try:
+        template_info = CrudCcTemplates.read_by_primary(db=db, namespace=namespace, template_name=template_name)[0]
+    except IndexError:
+        raise CcDataNotFoundError
+    _center_configs = _load_render_envs(db, namespace)
+    _deployed_hash = CrudCcDeployRecords.read_hashes(db, namespace, template_name).get(template_name)
+
+    # 渲染、发布
+    _start = time.perf_counter()
+    try:
+        result, _hash = _deploy_one(namespace, template_info, _center_configs, dry_run, force, _deployed_hash)
+    except Exception as e:
+        if not dry_run:
+            _record_deploy_metrics(CcDeployResult(
+                namespace=namespace,
+                template_name=template_name,
+                status='failed',
+                duration=time.perf_counter() - _start,
+                detail=f'{type(e).__name__}: {e}'
+            ))
+        raise
+    _record_deploy_metrics(result)
+    if _hash is not None:
+        CrudCcDeployRecords.record(db, namespace, {template_name: _hash})
+    return result
+
+
+def deploy_namespace(
+        db: Session,
+        namespace: str,
+        dry_run: bool = False,
+        force: bool = False,
+        template_names: Iterable[str] | None = None
+) -> List[CcDeployResult]:
+    """
+    渲染并发布 namespace 下的全部模板，配置只载入一次，发布通过有界线程池并发执行，单个模板失败不影响其他模板
+    :param dry_run: 仅渲染并与远端文件比对，结果中返回 unified diff，不备份、不写入
+    :param force: 渲染结果与上次发布成功的内容一致时仍然发布
+    :param template_names: 仅发布其中的模板，不传则发布全部模板
+    """
+    templates_info = CrudCcTemplates.read_by_primary(db=db, namespace=namespace)
+    if not templates_info:
+        raise CcDataNotFoundError
+    if template_names is not None:
+        template_names = set(template_names)
+        templates_info = [_ for _ in templates_info if _.template_name in template_names]
+        if not templates_info:
+            return []
+    _center_configs = _load_render_envs(db, namespace)
+    _deployed_hashes = CrudCcDeployRecords.read_hashes(db, namespace)
+
+    def _deploy(template_info: CcTemplates) -> Tuple[CcDeployResult, str | None]:
+        _start = time.perf_counter()
+        try:
+            return _deploy_one(
+                namespace,
+                template_info,
+                _center_configs,
+                dry_run,
+                force,
+                _deployed_hashes.get(template_info.template_name)
+            )
+        except Exception as e:
+            return CcDeployResult(
+                namespace=namespace,
+                template_name=template_info.template_name,
+                status='failed',
+                duration=time.perf_counter() - _start,
+                detail=f'{type(e).__name__}: {e}'
+            ), None
+
+    # 发布线程中不访问 session，传入与 session 脱离关系的模板信息副本
+    _templates = list(map(lambda _: CcTemplates.model_validate(_), templates_info))
+    with ThreadPoolExecutor(max_workers=min(int(ini.deploy_max_workers), len(_templates))) as executor:
+        _results = list(executor.map(_deploy, _templates))
+
+    for _r, _ in _results:
+        _record_deploy_metrics(_r)
+    # 发布记录在主线程中统一写入
+    CrudCcDeployRecords.record(
+        db,
+        namespace,
+        {_r.template_name: _hash for _r, _hash in _results if _hash is not None}
+    )
+    return [_r for _r, _ in _results]
+
+
+def _registry_render_envs(db: Session, namespace: str) -> dict:
+    """
+    注册时渲染配置值及模板目标信息所用的环境变量，与 registry 一致：snow 自身使用 ini 配置组代替 snow 配置组
+    """
+    _envs = _load_render_envs(db, namespace)
+    if namespace == ini.snow_namespace:
+        return {'myself': _envs['myself'], 'ini': ini.get_all_configs()}
+    return _envs
+
+
+def find_rerender_targets(db: Session, namespace: str, config_key: str) -> Dict[str, Dict[str, List[str]]]:
+    """
+    查找配置键变更后受影响的引用方：namespace 自身引用了该配置键的模板、配置、模板元数据；
+    变更的是 snow 配置时，还包括其他 namespace 中通过 snow 配置组引用了该配置键的引用方
+    :return: namespace -> 引用方，仅包含存在引用方的 namespace
+    """
+    _targets = {}
+    _dependants = TemplatesLibHandle.search_dependants(namespace, config_key)
+    if any(_dependants.values()):
+        _targets[namespace] = _dependants
+
+    if namespace == ini.snow_namespace:
+        try:
+            _namespaces = CrudCcNamespaces.read_by_primary(db)
+        except CcDataNotFoundError:
+            _namespaces = []
+        for _ns in _namespaces:
+            if _ns.namespace == ini.snow_namespace:
+                continue
+            try:
+                _dependants = TemplatesLibHandle.search_dependants(_ns.namespace, config_key, group='snow')
+            except CcResourcesError:
+                # 资源库已移除的 namespace 无法渲染，忽略
+                continue
+            if any(_dependants.values()):
+                _targets[_ns.namespace] = _dependants
+    return _targets
+
+
+def _rerender_dependant_rows(
+        db: Session,
+        namespace: str,
+        meta_namespace: str,
+        dependants: Dict[str, List[str]],
+        old_envs: dict,
+        new_envs: dict
+) -> Dict[str, List[str]]:
+    """
+    按元数据重新渲染引用方中的配置值及模板目标信息，不提交；
+    配置值及模板目标信息仅在仍与旧环境变量的渲染结果一致（即未被单独修改过）时才重新渲染
+    :param meta_namespace: 元数据所属的 namespace
+    :param new_envs: 新的环境变量，重新渲染后的配置值同时写入其中的 myself 配置组
+    :return: 重新渲染后发生变化的配置键及模板
+    """
+    _cc_configs_meta, _cc_templates_meta, _ = ResourcesHandle.get_library_data(meta_namespace)
+
+    # 重新渲染引用了该配置键的配置值，配置值之间存在引用链时逐轮渲染直至稳定
+    _configs_meta = [
+        _m for _m in _cc_configs_meta
+        if _m.key in dependants['configs']
+        and new_envs['myself'].get(_m.key) == Crud._render_value(_m.value, **old_envs)
+    ]
+    _values = {}
+    for _ in range(len(_configs_meta) + 1):
+        _changed = False
+        for _m in _configs_meta:
+            _v = Crud._render_value(_m.value, **new_envs)
+            if _v == new_envs['myself'].get(_m.key):
+                continue
+            new_envs['myself'][_m.key] = _values[_m.key] = _v
+            _changed = True
+        if not _changed:
+            break
+    CrudCcConfigs.update_values(db, namespace, _values, commit=False)
+
+    # 重新渲染引用了该配置键的模板目标信息
+    _templates = {_t.template_name: _t for _t in CrudCcTemplates.read_by_primary(db, namespace=namespace)}
+    _dest_infos = []
+    for _m in _cc_templates_meta:
+        _t = _templates.get(_m.template_name)
+        if _t is None or _m.template_name not in dependants['templates_meta']:
+            continue
+        if all(
+            getattr(_t, _f) == Crud._render_value(getattr(_m, _f), **old_envs) for _f in templates_meta_fields
+        ):
+            _row = {_f: Crud._render_value(getattr(_m, _f), **new_envs) for _f in templates_meta_fields}
+            if any(_row[_f] != getattr(_t, _f) for _f in templates_meta_fields):
+                _dest_infos.append({'template_name': _m.template_name, **_row})
+    CrudCcTemplates.update_dest_infos(db, namespace, _dest_infos, commit=False)
+
+    return {
+        'configs': sorted(_values),
+        'templates_meta': [_r['template_name'] for _r in _dest_infos]
+    }
+
+
+def rerender_config_dependants(
+        db: Session,
+        namespace: str,
+        config_key: str,
+        old_value: str
+) -> List[CcDeployResult]:
+    """
+    配置值变更后，重新渲染受影响的配置值、模板目标信息，并发布受影响的模板；
+    配置值及模板目标信息仅在仍与旧配置值的渲染结果一致（即未被单独修改过）时才按元数据重新渲染
+    :param old_value: 变更前的配置值
+    """
+    _results = []
+    for _ns, _dependants in find_rerender_targets(db, namespace, config_key).items():
+        _group = 'myself' if _ns == namespace else 'snow'
+        _new_envs = _registry_render_envs(db, _ns)
+        _old_envs = {_k: dict(_v) for _k, _v in _new_envs.items()}
+        _old_envs[_group][config_key] = old_value
+
+        # 同一个 namespace 的配置值及模板目标信息在一个事务中更新
+        try:
+            _rerender_dependant_rows(db, _ns, _ns, _dependants, _old_envs, _new_envs)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            CrudCcConfigs.invalidate_cache(_ns)
+
+        # 发布受影响的模板
+        _results.extend(deploy_namespace(
+            db,
+            _ns,
+            template_names={*_dependants['templates'], *_dependants['templates_meta']}
+        ))
+    return _results
+
+
+def clone_namespace(
+        db: Session,
+        source: str,
+        target: str,
+        overrides: Dict[str, str] | None = None,
+        rerender: bool = True,
+        copy_resources: bool = True
+) -> dict:
+    """
+    在一个事务中以 INSERT ... SELECT 将 source 的配置、模板信息及版本复制到 target，复制的数据不重新渲染；
+    overrides 中的配置按 target 的配置渲染后覆盖复制的值，rerender 为 true 时仅重新渲染引用了被覆盖配置的配置值及模板目标信息，
+    不发布模板
+    :param overrides: 配置键 -> 配置值，配置键需存在于 source
+    :param copy_resources: 是否复制资源库目录，target 的资源库目录已存在时不复制
+    :return: 各表复制的行数、被覆盖的配置键、重新渲染后发生变化的配置键及模板、引用了被覆盖配置需要重新发布的模板
+    """
+    overrides = overrides or {}
+    # target 同时作为资源库目录名
+    if not re.fullmatch(r'[A-Za-z0-9._-]+', target) or target in ('.', '..'):
+        raise CcResourcesError(f'Illegal namespace: {target}')
+    if db.get(CcNamespaces, target) is not None or CrudCcConfigs.exists(db, target):
+        raise CcDataConflictError(f'Namespace already exists: {target}')
+    if db.get(CcNamespaces, source) is None:
+        raise CcDataNotFoundError(f'Namespace not found: {source}')
+    _found = CrudCcConfigs.read_by_keys(db, source, overrides)
+    _missing = [_k for _k in overrides if _k not in _found]
+    if _missing:
+        raise CcDataNotFoundError(f'Configs not found (namespace: {source}, keys: {_missing})')
+
+    # 引用方按 source 的资源库查找，target 的资源库与其一致
+    _dependants = {'templates': set(), 'configs': set(), 'templates_meta': set()}
+    if rerender:
+        for _k in overrides:
+            for _kind, _names in TemplatesLibHandle.search_dependants(source, _k).items():
+                _dependants[_kind].update(_names)
+
+    _source_path = os.path.join(ini.resources_path, source)
+    _target_path = os.path.join(ini.resources_path, target)
+    _copy_resources = copy_resources and not os.path.exists(_target_path)
+    if _copy_resources and not os.path.isdir(_source_path):
+        raise CcResourcesError(f'Resource path not found! namespace: {source}')
+
+    _rerendered = {'configs': [], 'templates_meta': []}
+    try:
+        if _copy_resources:
+            shutil.copytree(_source_path, _target_path)
+        _counts = {
+            'configs': CrudCcConfigs.clone_namespace_rows(db, source, target, commit=False),
+            'templates': CrudCcTemplates.clone_namespace_rows(db, source, target, commit=False),
+            'namespaces': CrudCcNamespaces.clone(db, source, target, commit=False)
+        }
+        if overrides:
+            _new_envs = _registry_render_envs(db, target)
+            _old_envs = {_k: dict(_v) for _k, _v in _new_envs.items()}
+            _values = {_k: Crud._render_value(_v, **_new_envs) for _k, _v in overrides.items()}
+            _new_envs['myself'].update(_values)
+            CrudCcConfigs.update_values(db, target, _values, commit=False)
+            if rerender:
+                _rerendered = _rerender_dependant_rows(db, target, source, _dependants, _old_envs, _new_envs)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        if _copy_resources:
+            shutil.rmtree(_target_path, ignore_errors=True)
+        if isinstance(e, IntegrityError):
+            # 并发创建了同名 namespace
+            raise CcDataConflictError(f'Namespace already exists: {target}')
+        raise
+    finally:
+        CrudCcConfigs.invalidate_cache(target)
+
+    return {
+        'copied': _counts,
+        'overridden': sorted(overrides),
+        'rerendered': _rerendered,
+        'templates': sorted({*_dependants['templates'], *_dependants['templates_meta']})
+    }
+
+
+def read_configs_as_of(
+        db: Session,
+        namespace: str,
+        revision: int | None = None,
+        timestamp: datetime | None = None
+) -> Tuple[int, List[CcConfigs]]:
+    """
+    以当前配置为起点，逆序反向应用之后的变更记录，读取 namespace 在指定修订号或时间点的配置；不经过配置读缓存
+    :param revision: 修订号，未指定时为当前修订号
+    :param timestamp: 时间点，取该时间点及之前最后一次配置变更后的修订号，指定时忽略 revision
+    :return: 实际读取的修订号、配置（按配置键排序）
+    """
+    _current = CrudCcRevisions.read_revision(db, namespace)
+    _earliest = CrudCcConfigHistory.read_earliest_revision(db, namespace)
+    if _earliest is None:
+        _earliest = _current
+    if timestamp is not None:
+        revision = CrudCcConfigHistory.read_revision_at(db, namespace, timestamp)
+        if revision is None:
+            revision = _earliest
+    if revision is None or revision > _current:
+        revision = _current
+    if revision < _earliest:
+        raise CcDataNotFoundError(f'History not available before revision {_earliest} (namespace: {namespace})')
+
+    _configs = {
+        _key: {'value': _value, 'description': _description, 'category': _category}
+        for _key, _value, _description, _category in CrudCcConfigs.iter_namespace_rows(db, namespace)
+    }
+    for _key, _change, _old_value, _description, _category in CrudCcConfigHistory.iter_changes_after(
+            db, namespace, revision):
+        if _change == 'insert':
+            _configs.pop(_key, None)
+        elif _change == 'update':
+            if _key in _configs:
+                _configs[_key]['value'] = _old_value
+        else:
+            _configs[_key] = {'value': _old_value, 'description': _description or '', 'category': _category or ''}
+    return revision, [CcConfigs(namespace=namespace, key=_k, **_v) for _k, _v in sorted(_configs.items())]
+
+
+def rollback_configs(
+        db: Session,
+        namespace: str,
+        revision: int | None = None,
+        timestamp: datetime | None = None
+) -> dict:
+    """
+    在一个事务中将 namespace 的配置恢复到指定修订号或时间点，仅写入有变化的行；回滚本身同样记录变更，可再次回滚。
+    仅恢复配置，不重新渲染模板目标信息，不发布模板
+    :return: 回滚到的修订号、各类变化的行数、回滚后的修订号
+    """
+    if db.get(CcNamespaces, namespace) is None:
+        raise CcDataNotFoundError(f'Namespace not found: {namespace}')
+    try:
+        # 先递增修订号以锁定 namespace，之后读取的数据不会被回滚期间的并发写入改变
+        Crud._bump_revision(db, [namespace])
+        _revision, _configs = read_configs_as_of(db, namespace, revision=revision, timestamp=timestamp)
+        _counts = CrudCcConfigs.restore_namespace_rows(
+            db,
+            namespace,
+            map(lambda _: {'key': _.key, 'value': _.value, 'description': _.description, 'category': _.category},
+                _configs),
+            commit=False
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        CrudCcConfigs.invalidate_cache(namespace)
+    return {
+        'revision': _revision,
+        'configs': _counts,
+        'current_revision': CrudCcRevisions.read_revision(db, namespace)
+    }
+
+
+def _encode_export_row(export_format: str, row: tuple) -> str:
+    _key, _value, _description, _category = row
+    if export_format == 'json':
+        return json.dumps(
+            {'key': _key, 'value': _value, 'description': _description, 'category': _category},
+            ensure_ascii=False
+        ) + '\n'
+    elif export_format == 'env':
+        # 环境变量名仅允许字母、数字、下划线，且不能以数字开头
+        _name = re.sub(r'[^A-Za-z0-9_]', '_', _key)
+        if _name[:1].isdigit():
+            _name = f'_{_name}'
+        return f'{_name}={shlex.quote(_value or "")}\n'
+    else:
+        return next(KVFileContentAnalyzer.iter_unparse([(_key, _value or '', _description or None)]))
+
+
+def export_namespace_configs(
+        db: Session,
+        namespace: str,
+        export_format: str = 'kv',
+        is_gzip: bool = False,
+        chunk_size: int = 65536
+) -> Iterator[bytes]:
+    """
+    流式导出 namespace 下的全部配置，逐批读取、编码并输出，内存占用与配置数量无关
+    :param export_format: kv（key=value，与向导配置格式一致）、json（每行一个 json 对象）、env（shell 环境变量）
+    :param is_gzip: 是否以 gzip 压缩输出
+    :param chunk_size: 每次输出的字节数（压缩前）
+    """
+    _compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if is_gzip else None
+    _buffer = []
+    _buffer_size = 0
+    for _row in CrudCcConfigs.iter_namespace_rows(db, namespace):
+        _line = _encode_export_row(export_format, _row).encode('utf-8')
+        _buffer.append(_line)
+        _buffer_size += len(_line)
+        if _buffer_size >= chunk_size:
+            _chunk = b''.join(_buffer)
+            _buffer, _buffer_size = [], 0
+            if _compressor is not None:
+                _chunk = _compressor.compress(_chunk)
+            if _chunk:
+                yield _chunk
+    _chunk = b''.join(_buffer)
+    if _compressor is not None:
+        _chunk = _compressor.compress(_chunk) + _compressor.flush()
+    if _chunk:
+        yield _chunk
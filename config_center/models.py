@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy import Index, Column, Text
 from sqlmodel import Field, SQLModel
 
 
@@ -35,5 +36,152 @@ class CcTemplates(CcBase, table=True):
     dest_passwd: str
 
 
+class CcConfigsKey(CcBase):
+    key: str
+
+
+class CcConfigsBatchItem(CcConfigsKey):
+    value: str | None = None
+    # 配置不存在时为 False
+    found: bool
+
+
+class CcConfigHistory(SQLModel, table=True):
+    __tablename__ = 'cc_config_history'
+    __table_args__ = (Index('ix_cc_config_history_namespace_revision', 'namespace', 'revision'),)
+
+    id: int | None = Field(default=None, primary_key=True)
+    namespace: str
+    # 变更后 namespace 的修订号
+    revision: int
+    key: str
+    # insert: 新增，update: 配置值变化，delete: 删除
+    change: str
+    old_value: str | None = None
+    new_value: str | None = None
+    # 仅删除时记录，用于回滚时恢复配置
+    description: str | None = None
+    category: str | None = None
+    change_time: datetime = Field(default_factory=datetime.now)
+
+
+class CcRevisions(CcBase, table=True):
+    __tablename__ = 'cc_revisions'
+
+    revision: int = 0
+    update_time: datetime = Field(default_factory=datetime.now)
+
+
+class CcRegistryFingerprints(CcBase, table=True):
+    __tablename__ = 'cc_registry_fingerprints'
+
+    # 注册所用资源（VERSION、元数据、模板列表、向导配置及 ini 配置）的内容摘要
+    fingerprint: str
+    version: str
+    # 注册完成时 namespace 的修订号，之后通过接口修改过数据时不跳过注册
+    revision: int
+    update_time: datetime = Field(default_factory=datetime.now)
+
+
+class CcLocks(SQLModel, table=True):
+    __tablename__ = 'cc_locks'
+
+    name: str = Field(primary_key=True)
+    # 持有者标识，为空表示锁未被持有
+    owner: str | None = None
+    # 锁的过期时间，持有者异常退出时，过期后其他进程可重新获取
+    expire_time: datetime | None = None
+    # 最近一次持有者正常释放锁的时间
+    finish_time: datetime | None = None
+
+
+class CcDeployRecords(CcBase, table=True):
+    __tablename__ = 'cc_deploy_records'
+
+    template_name: str = Field(primary_key=True)
+    # 最近一次发布成功的内容摘要（包含目标地址、路径、用户及渲染结果）
+    content_hash: str
+    deploy_time: datetime = Field(default_factory=datetime.now)
+
+
 class CcRegistryInfo(CcBase):
     wizard_configs: str
+
+
+class CcCloneInfo(SQLModel):
+    # 新的 namespace
+    target: str
+    # 配置键 -> 配置值，覆盖复制的配置，配置值按新的 namespace 的配置渲染
+    overrides: dict[str, str] = {}
+    # 是否重新渲染引用了被覆盖配置的配置值及模板目标信息
+    rerender: bool = True
+    # 是否复制资源库目录，新的 namespace 的资源库目录已存在时不复制
+    copy_resources: bool = True
+
+
+class CcDeployResult(SQLModel):
+    namespace: str
+    template_name: str
+    # ok: 发布成功，skipped: 内容与上次发布一致而跳过，failed: 渲染或发布失败；
+    # 仅比对（dry run）时：changed: 内容有变化，unchanged: 内容无变化
+    status: str
+    # 渲染及发布耗时，单位：秒
+    duration: float
+    detail: str = ''
+    # 仅比对（dry run）时：远端文件与渲染结果的 unified diff
+    diff: str | None = None
+
+
+class CcDependencies(SQLModel):
+    namespace: str
+    # 配置键所属的配置组：myself 为 namespace 自身配置，snow 为 snow 配置
+    group: str
+    key: str
+    # 模板文件中引用了该配置键的模板
+    templates: list[str] = []
+    # 配置值中引用了该配置键的配置
+    configs: list[str] = []
+    # 目标地址、路径、用户、密码中引用了该配置键的模板
+    templates_meta: list[str] = []
+
+
+class CcJobs(SQLModel, table=True):
+    __tablename__ = 'cc_jobs'
+
+    job_id: str = Field(primary_key=True)
+    # 任务类型：deploy_template、deploy_namespace、rerender
+    kind: str
+    namespace: str = Field(index=True)
+    # queued: 排队中，running: 执行中，done: 执行完成，failed: 执行异常
+    status: str = Field(default='queued', index=True)
+    # 任务参数，json 格式；payload、results、logs、detail 长度不定，使用 TEXT 类型（str 在 MySQL 中为 VARCHAR(255)）
+    payload: str = Field(default='{}', sa_column=Column(Text, nullable=False))
+    submit_time: datetime = Field(default_factory=datetime.now)
+    start_time: datetime | None = None
+    finish_time: datetime | None = None
+    # 执行次数，服务重启后重新执行的任务会大于 1
+    attempts: int = 0
+    # 各模板的发布结果，json 格式
+    results: str = Field(default='[]', sa_column=Column(Text, nullable=False))
+    logs: str = Field(default='', sa_column=Column(Text, nullable=False))
+    detail: str = Field(default='', sa_column=Column(Text, nullable=False))
+    # 执行中任务的持有进程标识及租约到期时间，持有进程定时续约，租约过期说明持有进程已退出
+    owner: str | None = None
+    lease_expire_time: datetime | None = None
+
+
+class CcJob(SQLModel):
+    job_id: str
+    kind: str
+    namespace: str
+    status: str
+    submit_time: datetime
+    start_time: datetime | None = None
+    finish_time: datetime | None = None
+    attempts: int = 0
+    # 排队耗时及执行耗时，单位：秒
+    queue_duration: float | None = None
+    run_duration: float | None = None
+    # 各模板的发布结果，包含每个模板的渲染及发布耗时
+    results: list[CcDeployResult] = []
+    detail: str = ''
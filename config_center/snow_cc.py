@@ -1,9 +1,13 @@
-from urllib.parse import quote_plus
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import PlainTextResponse
-from sqlmodel import create_engine, Session
-from contextlib import asynccontextmanager
+import time
+from datetime import datetime
+from typing import Literal
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from contextlib import asynccontextmanager, contextmanager
 import fastapi_cdn_host
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
 from pathlib import Path
 
 import ini
@@ -12,41 +16,141 @@ from models import (
     CcTemplates,
     CcNamespaces,
     CcRegistryInfo,
+    CcCloneInfo,
     CcConfigsBase,
+    CcDeployResult,
+    CcConfigsKey,
+    CcConfigsBatchItem,
+    CcConfigHistory,
+    CcDependencies,
+    CcJob,
 )
 from crud import (
     CrudCcConfigs,
     CrudCcNamespaces,
     CrudCcTemplates,
+    CrudCcRevisions,
+    CrudCcConfigHistory,
+    CrudCcJobs,
     create_db_and_tables
 )
 from errors import (
     CcDataNotFoundError,
-    CcTemplateNotFoundError
+    CcDataConflictError,
+    CcRenderError,
+    CcTemplateNotFoundError,
+    CcResourcesError
 )
 import middlewave
+from jobs import job_manager
+from cache_sync import revision_watcher
+from database import engine, async_engine, get_session, get_read_session
+from utils.jinja_handler import JinjaHandler
+from utils.templates_lib_handler import TemplatesLibHandle
+from utils import metrics
 
 
-engine = create_engine(
-    f"mysql+pymysql://{ini.db_user}:{quote_plus(ini.db_pass)}@{ini.db_host}:{ini.db_port}/{ini.db_name}",
-    echo=True if ini.log_level.lower() == 'debug' else False,
-    # 后续如果需要支持连接池，可以把该参数改为True
-    echo_pool=False,
-    connect_args=ini.connect_args
-)
+job_manager.register('deploy_template', middlewave.deploy_template)
+job_manager.register('deploy_namespace', middlewave.deploy_namespace)
+job_manager.register('rerender', middlewave.rerender_config_dependants)
+
+
+# 固定路径路由（须注册在所有 /{namespace}/… 路由之前）的首段，用作 namespace 时其路由会被遮蔽
+reserved_namespaces = ('jobs', 'namespaces', 'stats', 'registry', 'metrics')
 
 
-def get_session():
-    with Session(engine) as session:
-        yield session
+def check_reserved_namespace(namespace: str):
+    if namespace in reserved_namespaces:
+        raise HTTPException(
+            status_code=400,
+            detail=f"The namespace is reserved by snow's routes ({namespace}), Change it.")
+
+
+def make_etag(namespace: str, revision: int) -> str:
+    return f'"{namespace}-{revision}"'
+
+
+async def get_etag(session: Session | AsyncSession, namespace: str) -> str:
+    return make_etag(namespace, await CrudCcRevisions.aread_known_revision(session, namespace))
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """
+    判断请求头 If-None-Match 是否与当前 ETag 匹配，匹配时无需返回数据
+    """
+    _if_none_match = request.headers.get('if-none-match')
+    if not _if_none_match:
+        return False
+    for _tag in _if_none_match.split(','):
+        _tag = _tag.strip()
+        if _tag == '*' or _tag.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+def collect_component_metrics():
+    """
+    导出各组件自行统计的数据：配置读缓存、jinja 编译缓存命中数及 SSH 连接池状态
+    """
+    _cache = CounterMetricFamily(
+        'snow_cc_cache_requests', 'Cache lookups by cache and result', labels=['cache', 'result'])
+    _config_stats = CrudCcConfigs.cache_stats()
+    _jinja_stats = JinjaHandler.stats()
+    for _name, _stats in (
+            ('config', _config_stats),
+            ('jinja_string', _jinja_stats['string_templates']),
+            ('jinja_bytecode', _jinja_stats['file_templates_bytecode'])
+    ):
+        _cache.add_metric([_name, 'hit'], _stats['hits'])
+        _cache.add_metric([_name, 'miss'], _stats['misses'])
+    yield _cache
+
+    _ssh_pool_stats = middlewave.ssh_pool.stats()
+    _ssh_connections = GaugeMetricFamily(
+        'snow_cc_ssh_pool_connections', 'Pooled SSH connections by state', labels=['state'])
+    _ssh_connections.add_metric(['idle'], _ssh_pool_stats['idle'])
+    _ssh_connections.add_metric(['in_use'], _ssh_pool_stats['in_use'])
+    yield _ssh_connections
+
+
+metrics.register_collector(collect_component_metrics)
+
+
+@contextmanager
+def startup_phase(name: str):
+    _start = time.perf_counter()
+    yield
+    print(f'Startup phase [{name}] finished in {(time.perf_counter() - _start) * 1000:.1f} ms')
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    create_db_and_tables(engine)
-    with Session(engine) as session:
-        middlewave.init_snow_configs(session)
+    _started_at = datetime.now()
+    _start = time.perf_counter()
+    with startup_phase('create tables'):
+        create_db_and_tables(engine)
+
+    def _startup():
+        with startup_phase('snow registry'), Session(engine) as session:
+            _counts = middlewave.init_snow_configs(session)
+            print(f'Snow registry: {_counts}' if _counts is not None else 'Snow registry: resources unchanged, skipped')
+        with startup_phase('recover jobs'):
+            print(f'Resumed jobs: {job_manager.recover()}')
+
+    # 多个工作进程同时启动时，snow 配置注册及任务恢复只由一个进程执行
+    with startup_phase('startup lock'), Session(engine) as session:
+        if not middlewave.run_once_at_startup(session, 'startup', _started_at, _startup):
+            print('Startup registry already done by another worker, skipped')
+    with startup_phase('revision watcher'):
+        revision_watcher.start()
+    job_manager.start()
+    print(f'Application Startup finished in {(time.perf_counter() - _start) * 1000:.1f} ms')
     yield
+    revision_watcher.stop()
+    job_manager.shutdown()
+    middlewave.ssh_pool.close_all()
+    if async_engine is not None:
+        await async_engine.dispose()
     print('Application Shutdown.')
 
 
@@ -57,49 +161,234 @@ cc = FastAPI(
 fastapi_cdn_host.patch_docs(cc, Path(__file__).parent / "static")
 
 
+@cc.middleware('http')
+async def observe_request_duration(request: Request, call_next):
+    _start = time.perf_counter()
+    _status = 500
+    try:
+        response = await call_next(request)
+        _status = response.status_code
+        return response
+    finally:
+        # 以路由模板作为标签，避免路径参数导致时间序列无限增长
+        _route = request.scope.get('route')
+        metrics.http_request_duration.labels(
+            method=request.method,
+            route=_route.path if _route is not None else 'unmatched',
+            status=str(_status),
+            namespace=metrics.namespace_label(request.path_params.get('namespace'))
+        ).observe(time.perf_counter() - _start)
+
+
 @cc.get("/", status_code=201, response_model=str)
 def hello():
     return PlainTextResponse("Welcome Snow ConfigCenter", status_code=201)
 
 
+@cc.get("/metrics", status_code=200, response_class=Response)
+def read_metrics():
+    return Response(metrics.generate(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+
 @cc.get("/namespaces", status_code=201, response_model=list[CcNamespaces])
-def get_all_namespaces(*, session: Session = Depends(get_session)):
+async def get_all_namespaces(*, session: Session | AsyncSession = Depends(get_read_session)):
     try:
-        return CrudCcNamespaces.read_by_primary(session)
+        return await CrudCcNamespaces.aread_by_primary(session)
     except CcDataNotFoundError:
         return []
 
 
-@cc.get("/{namespace}/configs", status_code=201, response_model=list[CcConfigs])
-def get_namespace_configs(
+@cc.post("/namespaces/{namespace}/clone", status_code=201, response_model=dict)
+def clone_namespace(
         *,
         session: Session = Depends(get_session),
         namespace: str,
+        data: CcCloneInfo
 ):
+    """
+    以 namespace 为模板创建新的 namespace（如同一产品的另一套环境），复制其配置、模板信息及版本，可覆盖部分配置；
+    不发布模板，需要时通过 /{target}/render 发布
+    """
+    if ini.snow_namespace in (namespace, data.target):
+        raise HTTPException(
+            status_code=400,
+            detail=f"The namespace is snow's namespace, Change it.")
+    check_reserved_namespace(data.target)
     try:
-        return CrudCcConfigs.read_by_primary(session, namespace=namespace)
+        return middlewave.clone_namespace(
+            session,
+            namespace,
+            data.target,
+            overrides=data.overrides,
+            rerender=data.rerender,
+            copy_resources=data.copy_resources
+        )
+    except CcDataConflictError as e:
+        raise HTTPException(status_code=409, detail=f"{e}")
+    except CcDataNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"{e}")
+    except (CcResourcesError, CcRenderError) as e:
+        raise HTTPException(status_code=400, detail=f"{e}")
+
+
+@cc.get("/stats/ssh_pool", status_code=201, response_model=dict)
+def get_ssh_pool_stats():
+    return middlewave.ssh_pool.stats()
+
+
+@cc.get("/stats/jinja", status_code=201, response_model=dict)
+def get_jinja_stats():
+    return JinjaHandler.stats()
+
+
+@cc.get("/jobs", status_code=201, response_model=list[CcJob])
+def read_jobs(
+        *,
+        session: Session = Depends(get_session),
+        namespace: str | None = None,
+        status: Literal['queued', 'running', 'done', 'failed'] | None = None,
+        limit: int = Query(default=100, ge=1, le=1000)
+):
+    return list(map(job_manager.to_job, CrudCcJobs.read_jobs(session, namespace, status, limit)))
+
+
+@cc.get("/jobs/{job_id}", status_code=201, response_model=CcJob)
+def read_job(
+        *,
+        session: Session = Depends(get_session),
+        job_id: str
+):
+    try:
+        return job_manager.to_job(CrudCcJobs.read_by_primary(session, job_id))
+    except CcDataNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Job not found (job_id: {job_id})"
+        )
+
+
+@cc.get("/jobs/{job_id}/logs", status_code=201, response_model=str)
+def read_job_logs(
+        *,
+        session: Session = Depends(get_session),
+        job_id: str
+):
+    try:
+        return PlainTextResponse(CrudCcJobs.read_by_primary(session, job_id).logs, status_code=201)
+    except CcDataNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Job not found (job_id: {job_id})"
+        )
+
+
+@cc.post("/configs:batch", status_code=201, response_model=list[CcConfigsBatchItem])
+async def get_configs_batch(
+        *,
+        session: Session | AsyncSession = Depends(get_read_session),
+        items: list[CcConfigsKey]
+):
+    if len(items) > int(ini.config_batch_max_items):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many items (max: {ini.config_batch_max_items}, got: {len(items)})")
+    # 按 namespace 分组，每个 namespace 一次 IN 查询
+    _keys_by_namespace = {}
+    for _i in items:
+        _keys_by_namespace.setdefault(_i.namespace, []).append(_i.key)
+    _configs = {}
+    for _ns, _keys in _keys_by_namespace.items():
+        _configs[_ns] = await CrudCcConfigs.aread_by_keys(session, _ns, _keys)
+
+    _result = []
+    for _i in items:
+        _config = _configs[_i.namespace].get(_i.key)
+        _result.append(CcConfigsBatchItem(
+            namespace=_i.namespace,
+            key=_i.key,
+            value=_config.value if _config else None,
+            found=_config is not None
+        ))
+    return _result
+
+
+@cc.get("/{namespace}/configs", status_code=201, response_model=list[CcConfigs])
+async def get_namespace_configs(
+        *,
+        session: Session | AsyncSession = Depends(get_read_session),
+        request: Request,
+        response: Response,
+        namespace: str,
+):
+    # 先读取本进程已知的修订号，再读取不早于该修订号的数据（缓存的修订号不一致时查库），ETag 不会新于其标识的数据；
+    # 数据存在时才处理 If-None-Match，404 不返回 ETag
+    _revision = await CrudCcRevisions.aread_known_revision(session, namespace)
+    try:
+        _configs = await CrudCcConfigs.aread_by_primary(session, namespace=namespace, revision=_revision)
     except CcDataNotFoundError:
         raise HTTPException(status_code=404, detail=f"Configs not found (namespace: {namespace})")
+    _etag = make_etag(namespace, _revision)
+    if is_not_modified(request, _etag):
+        return Response(status_code=304, headers={'ETag': _etag})
+    response.headers['ETag'] = _etag
+    return _configs
 
 
-@cc.get("/{namespace}/configs/{config_key}", status_code=201, response_model=CcConfigs | str)
-def get_config(
+@cc.get("/{namespace}/export", status_code=201, response_class=StreamingResponse)
+def export_namespace_configs(
         *,
         session: Session = Depends(get_session),
         namespace: str,
+        export_format: Literal['kv', 'json', 'env'] = Query('kv', alias='format'),
+        gzip: bool = False
+):
+    if not CrudCcConfigs.exists(session, namespace):
+        raise HTTPException(status_code=404, detail=f"Configs not found (namespace: {namespace})")
+
+    # 依赖注入的 session 在响应开始输出前即关闭，流式输出使用独立的 session
+    def _iter_content():
+        with Session(engine) as _session:
+            yield from middlewave.export_namespace_configs(_session, namespace, export_format, is_gzip=gzip)
+
+    _file_name = f'{namespace}.{export_format}'
+    _media_type = {'kv': 'text/plain', 'json': 'application/x-ndjson', 'env': 'text/plain'}[export_format]
+    if gzip:
+        _file_name += '.gz'
+        _media_type = 'application/gzip'
+    return StreamingResponse(
+        _iter_content(),
+        status_code=201,
+        media_type=_media_type,
+        headers={'Content-Disposition': f'attachment; filename="{_file_name}"'}
+    )
+
+
+@cc.get("/{namespace}/configs/{config_key}", status_code=201, response_model=CcConfigs | str)
+async def get_config(
+        *,
+        session: Session | AsyncSession = Depends(get_read_session),
+        request: Request,
+        response: Response,
+        namespace: str,
         config_key: str,
         only_value: bool = True
 ):
+    _revision = await CrudCcRevisions.aread_known_revision(session, namespace)
     try:
-        _config = CrudCcConfigs.read_by_primary(session, namespace=namespace, key=config_key)[0]
+        _config = (await CrudCcConfigs.aread_by_primary(
+            session, namespace=namespace, key=config_key, revision=_revision))[0]
     except (IndexError, CcDataNotFoundError):
         raise HTTPException(
             status_code=404,
             detail=f"Config not found (namespace: {namespace}, config_key: {config_key}')"
         )
+    _etag = make_etag(namespace, _revision)
+    if is_not_modified(request, _etag):
+        return Response(status_code=304, headers={'ETag': _etag})
     if only_value:
-        return PlainTextResponse(_config.value, status_code=201)
+        return PlainTextResponse(_config.value, status_code=201, headers={'ETag': _etag})
     else:
+        response.headers['ETag'] = _etag
         return _config
 
 
@@ -107,47 +396,160 @@ def get_config(
 def update_config_value(
         *,
         session: Session = Depends(get_session),
+        response: Response,
         namespace: str,
         config_key: str,
         update_row: CcConfigsBase,
+        rerender: bool = False
 ):
-    if update_row.namespace != namespace or update_row.template_name != config_key:
+    """
+    rerender 为 true 时，在后台重新渲染并发布引用了该配置的模板（snow 配置变更时包括其他 namespace 中的引用方），
+    任务 ID 通过响应头 X-Job-Id 返回，可通过 /jobs/{job_id} 查询执行结果
+    """
+    if update_row.namespace != namespace or update_row.key != config_key:
         raise HTTPException(
             status_code=400,
             detail=f"Input Args mismatch(namespace: {namespace}, config_key: {config_key}, row: {update_row})"
         )
     try:
-        return CrudCcConfigs.update_config_value(session, update_row)
+        _old_value = CrudCcConfigs.read_by_primary(session, namespace=namespace, key=config_key)[0].value
+        _row = CrudCcConfigs.update_config_value(session, update_row)
     except CcDataNotFoundError:
         raise HTTPException(
             status_code=404,
             detail=f"Config not found ({update_row})"
         )
+    if rerender and _row.value != _old_value:
+        _job = job_manager.submit(
+            'rerender',
+            namespace,
+            {'namespace': namespace, 'config_key': config_key, 'old_value': _old_value}
+        )
+        response.headers['X-Job-Id'] = _job.job_id
+    return _row
 
 
-@cc.get("/{namespace}/templates", status_code=201, response_model=list[CcTemplates])
-def get_templates(
+@cc.get("/{namespace}/history", status_code=201, response_model=list[CcConfigHistory])
+def read_config_history(
         *,
         session: Session = Depends(get_session),
         namespace: str,
+        key: str | None = None,
+        since_revision: int | None = None,
+        limit: int = Query(default=100, ge=1, le=10000)
 ):
-    return CrudCcTemplates.read_by_primary(session, namespace=namespace)
+    """
+    配置值的变更记录，最近的变更在前
+    """
+    return CrudCcConfigHistory.read_history(
+        session, namespace, key=key, since_revision=since_revision, limit=limit)
 
 
-@cc.get("/{namespace}/templates/{template_name}", status_code=201, response_model=list[CcTemplates])
-def get_template_meta(
+@cc.get("/{namespace}/history/configs", status_code=201, response_model=list[CcConfigs])
+def read_configs_as_of(
         *,
         session: Session = Depends(get_session),
+        response: Response,
         namespace: str,
-        template_name: str
+        revision: int | None = Query(default=None, ge=0),
+        timestamp: datetime | None = None
 ):
+    """
+    读取 namespace 在指定修订号或时间点（二选一，均未指定时为当前）的全部配置，实际读取的修订号通过响应头 X-Revision 返回
+    """
+    if revision is not None and timestamp is not None:
+        raise HTTPException(status_code=400, detail=f"Specify either revision or timestamp, not both.")
     try:
-        return CrudCcTemplates.read_by_primary(session, namespace=namespace, template_name=template_name)
-    except CcDataNotFoundError:
+        _revision, _configs = middlewave.read_configs_as_of(
+            session, namespace, revision=revision, timestamp=timestamp)
+    except CcDataNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"{e}")
+    if not _configs:
+        raise HTTPException(status_code=404, detail=f"Configs not found (namespace: {namespace})")
+    response.headers['X-Revision'] = str(_revision)
+    return _configs
+
+
+@cc.post("/{namespace}/history/rollback", status_code=201, response_model=dict)
+def rollback_configs(
+        *,
+        session: Session = Depends(get_session),
+        namespace: str,
+        revision: int | None = Query(default=None, ge=0),
+        timestamp: datetime | None = None
+):
+    """
+    在一个事务中将 namespace 的配置恢复到指定修订号或时间点（二选一），不发布模板，需要时通过 /{namespace}/render 发布
+    """
+    if (revision is None) == (timestamp is None):
+        raise HTTPException(status_code=400, detail=f"Specify either revision or timestamp.")
+    try:
+        return middlewave.rollback_configs(session, namespace, revision=revision, timestamp=timestamp)
+    except CcDataNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"{e}")
+
+
+@cc.get("/{namespace}/dependencies/{config_key}", status_code=201, response_model=CcDependencies)
+def read_config_dependencies(
+        *,
+        namespace: str,
+        config_key: str,
+        group: Literal['myself', 'snow'] = 'myself',
+        transitive: bool = True
+):
+    """
+    查询 namespace 资源中引用了指定配置键的模板、配置及模板元数据；
+    transitive 为 true 时包含通过配置值间接引用的引用方
+    """
+    try:
+        _dependants = TemplatesLibHandle.search_dependants(namespace, config_key, group, transitive)
+    except CcResourcesError as e:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Resources not found or illegal (namespace: {namespace}): {e}"
+        )
+    return CcDependencies(namespace=namespace, group=group, key=config_key, **_dependants)
+
+
+@cc.get("/{namespace}/templates", status_code=201, response_model=list[CcTemplates])
+async def get_templates(
+        *,
+        session: Session | AsyncSession = Depends(get_read_session),
+        request: Request,
+        response: Response,
+        namespace: str,
+):
+    # 先读取修订号再读取数据，ETag 不会新于其标识的数据；没有模板时不处理 If-None-Match，也不返回 ETag
+    _etag = await get_etag(session, namespace)
+    _templates = await CrudCcTemplates.aread_by_primary(session, namespace=namespace)
+    if not _templates:
+        return _templates
+    if is_not_modified(request, _etag):
+        return Response(status_code=304, headers={'ETag': _etag})
+    response.headers['ETag'] = _etag
+    return _templates
+
+
+@cc.get("/{namespace}/templates/{template_name}", status_code=201, response_model=list[CcTemplates])
+async def get_template_meta(
+        *,
+        session: Session | AsyncSession = Depends(get_read_session),
+        request: Request,
+        response: Response,
+        namespace: str,
+        template_name: str
+):
+    _etag = await get_etag(session, namespace)
+    _templates = await CrudCcTemplates.aread_by_primary(session, namespace=namespace, template_name=template_name)
+    if not _templates:
         raise HTTPException(
             status_code=404,
             detail=f"Template not found (namespace: {namespace}, template_name: {template_name})"
         )
+    if is_not_modified(request, _etag):
+        return Response(status_code=304, headers={'ETag': _etag})
+    response.headers['ETag'] = _etag
+    return _templates
 
 
 @cc.put("/{namespace}/templates/{template_name}", status_code=201, response_model=CcTemplates)
@@ -175,15 +577,33 @@ def update_template_info(
         )
 
 
-@cc.get("/{namespace}/templates/{template_name}/render", status_code=201, response_model=None)
+@cc.get("/{namespace}/templates/{template_name}/render", status_code=201, response_model=CcDeployResult | CcJob)
 def render_template(
         *,
         session: Session = Depends(get_session),
         namespace: str,
         template_name: str,
+        force: bool = False,
+        background: bool = False
 ):
+    """
+    渲染结果与上次发布成功的内容一致时跳过发布（status 为 skipped），force 为 true 时强制发布；
+    background 为 true 时提交为后台任务，立即返回任务信息，可通过 /jobs/{job_id} 查询执行结果
+    """
+    if background:
+        try:
+            CrudCcTemplates.read_by_primary(session, namespace=namespace, template_name=template_name)[0]
+        except (IndexError, CcDataNotFoundError):
+            raise HTTPException(
+                status_code=404,
+                detail=f"Template or Namespace not found (namespace: {namespace}, template_name: {template_name})")
+        return job_manager.submit(
+            'deploy_template',
+            namespace,
+            {'namespace': namespace, 'template_name': template_name, 'force': force}
+        )
     try:
-        middlewave.deploy_template(session, namespace, template_name)
+        return middlewave.deploy_template(session, namespace, template_name, force=force)
     except CcDataNotFoundError:
         raise HTTPException(
             status_code=404,
@@ -194,6 +614,68 @@ def render_template(
             detail=f"Template file not found (namespace: {namespace}, template_name: {template_name})")
 
 
+@cc.get("/{namespace}/templates/{template_name}/diff", status_code=201, response_model=str)
+def diff_template(
+        *,
+        session: Session = Depends(get_session),
+        namespace: str,
+        template_name: str,
+):
+    try:
+        return PlainTextResponse(
+            middlewave.deploy_template(session, namespace, template_name, dry_run=True).diff,
+            status_code=201
+        )
+    except CcDataNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Template or Namespace not found (namespace: {namespace}, template_name: {template_name})")
+    except CcTemplateNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Template file not found (namespace: {namespace}, template_name: {template_name})")
+
+
+@cc.get("/{namespace}/render", status_code=201, response_model=list[CcDeployResult] | CcJob)
+def render_namespace_templates(
+        *,
+        session: Session = Depends(get_session),
+        namespace: str,
+        force: bool = False,
+        background: bool = False
+):
+    """
+    渲染结果与上次发布成功的内容一致的模板跳过发布（status 为 skipped），force 为 true 时强制发布；
+    background 为 true 时提交为后台任务，立即返回任务信息，可通过 /jobs/{job_id} 查询执行结果
+    """
+    if background:
+        if not CrudCcTemplates.read_by_primary(session, namespace=namespace):
+            raise HTTPException(
+                status_code=404,
+                detail=f"Templates or Configs not found (namespace: {namespace})")
+        return job_manager.submit('deploy_namespace', namespace, {'namespace': namespace, 'force': force})
+    try:
+        return middlewave.deploy_namespace(session, namespace, force=force)
+    except CcDataNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Templates or Configs not found (namespace: {namespace})")
+
+
+@cc.get("/{namespace}/diff", status_code=201, response_model=list[CcDeployResult])
+def diff_namespace_templates(
+        *,
+        session: Session = Depends(get_session),
+        namespace: str,
+):
+    try:
+        return middlewave.deploy_namespace(session, namespace, dry_run=True)
+    except CcDataNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Templates or Configs not found (namespace: {namespace})")
+
+
 @cc.post("/registry/wizard", status_code=201, response_model=str)
 def registry_wizard(
         *,
@@ -204,6 +686,7 @@ def registry_wizard(
         raise HTTPException(
             status_code=400,
             detail=f"The namespace is snow's namespace, Change it.")
+    check_reserved_namespace(namespace)
     try:
         return PlainTextResponse(
             middlewave.execute_wizard(
@@ -226,6 +709,7 @@ def registry_register(
         raise HTTPException(
             status_code=400,
             detail=f"The namespace is snow's namespace, Change it.")
+    check_reserved_namespace(data.namespace)
     middlewave.registry(
         db_session=session,
         data=data
@@ -239,5 +723,5 @@ if __name__ == '__main__':
         host='0.0.0.0',
         port=int(ini.api_port),
         reload=False,
-        workers=1
+        workers=int(ini.api_workers)
     )
@@ -0,0 +1,12 @@
+import middlewave
+
+
+def test_export_null_value_as_empty():
+    _row = ('k1', None, None, None)
+    assert middlewave._encode_export_row('kv', _row) == 'k1=\n'
+    assert middlewave._encode_export_row('env', _row) == "k1=''\n"
+    assert middlewave._encode_export_row('json', _row).startswith('{"key": "k1", "value": null')
+
+
+def test_export_kv_with_description():
+    assert middlewave._encode_export_row('kv', ('k1', 'v=1', 'desc', None)) == '# desc\nk1=v=1\n'
@@ -3,9 +3,13 @@ __all__ = [
 ]
 
 import os
+import uuid
+import shlex
 from datetime import datetime
+from typing import Iterable, Iterator
 
-from utils.SSHConnectHandle import SSHConnectHandle
+from utils.SSHConnectHandle import SSHConnectHandle, SSHConnectPool, CommandExecError
+from utils import metrics
 
 
 class NetFileHandle:
@@ -15,26 +19,68 @@ class NetFileHandle:
             ssh_port: str,
             username: str,
             password: str,
-            file_path: str
+            file_path: str,
+            pool: SSHConnectPool | None = None,
+            transfer_mode: str = 'shell',
+            chunk_size: int = 32768
     ):
         self._ssh_handler = SSHConnectHandle(
             host=host,
             port=ssh_port,
             username=username,
-            password=password
+            password=password,
+            pool=pool
         )
         self._file_path = file_path
+        self._transfer_mode = transfer_mode
+        self._chunk_size = chunk_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     def read(self):
+        if self._transfer_mode == 'sftp':
+            with metrics.timer(metrics.ssh_operation_duration, operation='transfer'):
+                with self._ssh_handler.open_sftp().open(self._file_path, mode='rb') as f:
+                    return f.read().decode('utf-8').rstrip()
         return self._ssh_handler.exec_command('cat {}'.format(self._file_path), is_return_stdout=True).rstrip()
 
-    def write(self, data: str, is_overwrite: bool = True):
+    def read_raw(self) -> str | None:
+        """
+        原样读取文件内容（不去除末尾空白），文件不存在时返回 None；shell 传输方式下读取失败均视为文件不存在
+        """
+        if self._transfer_mode == 'sftp':
+            try:
+                with metrics.timer(metrics.ssh_operation_duration, operation='transfer'):
+                    with self._ssh_handler.open_sftp().open(self._file_path, mode='rb') as f:
+                        return f.read().decode('utf-8')
+            except FileNotFoundError:
+                return None
+        try:
+            return self._ssh_handler.exec_command(
+                'cat {}'.format(shlex.quote(self._file_path)), is_return_stdout=True, get_pty=False)
+        except CommandExecError:
+            return None
+
+    def write(self, data: str | Iterable[str], is_overwrite: bool = True):
+        if self._transfer_mode == 'sftp':
+            with metrics.timer(metrics.ssh_operation_duration, operation='transfer'):
+                return self._sftp_write(data, is_overwrite)
+        if not isinstance(data, str):
+            data = ''.join(data)
         if is_overwrite:
             return self._ssh_handler.exec_command('echo -e "{0}" > {1}'.format(data, self._file_path))
         else:
             return self._ssh_handler.exec_command('echo -e "{0}" >> {1}'.format(data, self._file_path))
 
     def copy(self, src: str, dst: str):
+        if self._transfer_mode == 'sftp':
+            # 服务端直接复制，文件内容不经过本地；无需伪终端
+            return self._ssh_handler.exec_command(
+                '\\cp {} {}'.format(shlex.quote(src), shlex.quote(dst)), get_pty=False)
         return self._ssh_handler.exec_command('\\cp {} {}'.format(src, dst))
 
     def close(self):
@@ -43,6 +89,85 @@ class NetFileHandle:
     def delete(self):
         return self._ssh_handler.exec_command('rm -f {}'.format(self._file_path))
 
+    def _iter_chunks(self, data: str | Iterable[str]) -> Iterator[bytes]:
+        """
+        将待写入内容按 chunk_size 切分为字节块，与 echo 一致，在内容末尾补一个换行符
+        """
+        if isinstance(data, str):
+            data = [data]
+        _buffer = bytearray()
+        for _piece in data:
+            _buffer += _piece.encode('utf-8')
+            while len(_buffer) >= self._chunk_size:
+                yield bytes(_buffer[:self._chunk_size])
+                del _buffer[:self._chunk_size]
+        _buffer += b'\n'
+        yield bytes(_buffer)
+
+    def _sftp_write(self, data: str | Iterable[str], is_overwrite: bool):
+        """
+        通过 SFTP 分块写入，内容原样传输，不经过 shell 转义；
+        覆盖写入时先写入目标文件（软链接取其指向的文件）同目录的临时文件，保留原文件的权限及属主后原子重命名为目标文件，
+        写入中途失败不会破坏原文件；目录不可写或无法保留属主时退回原地写入
+        """
+        _sftp = self._ssh_handler.open_sftp()
+        if not is_overwrite:
+            with _sftp.open(self._file_path, mode='ab') as f:
+                self._sftp_write_chunks(f, data)
+            return
+
+        try:
+            _real_path = _sftp.normalize(self._file_path)
+        except IOError:
+            # 目标文件不存在
+            _real_path = self._file_path
+        try:
+            _stat = _sftp.stat(_real_path)
+        except FileNotFoundError:
+            _stat = None
+        _tmp_path = os.path.join(
+            os.path.dirname(_real_path),
+            '.{0}.{1}.tmp'.format(os.path.basename(_real_path), uuid.uuid4().hex)
+        )
+        try:
+            _tmp_file = _sftp.open(_tmp_path, mode='wb')
+        except PermissionError:
+            # 目录不可写
+            return self._sftp_write_in_place(_sftp, _real_path, data)
+        try:
+            with _tmp_file as f:
+                # 写入内容前保留属主及权限，data 可能是只能迭代一次的生成器
+                if _stat is not None:
+                    _tmp_stat = f.stat()
+                    if (_tmp_stat.st_uid, _tmp_stat.st_gid) != (_stat.st_uid, _stat.st_gid):
+                        try:
+                            f.chown(_stat.st_uid, _stat.st_gid)
+                        except PermissionError:
+                            # 无权保留原文件的属主，放弃原子替换
+                            f.close()
+                            _sftp.remove(_tmp_path)
+                            return self._sftp_write_in_place(_sftp, _real_path, data)
+                    f.chmod(_stat.st_mode & 0o7777)
+                self._sftp_write_chunks(f, data)
+            _sftp.posix_rename(_tmp_path, _real_path)
+        except BaseException:
+            try:
+                _sftp.remove(_tmp_path)
+            except FileNotFoundError:
+                pass
+            except Exception:
+                self._ssh_handler.mark_broken()
+            raise
+
+    def _sftp_write_in_place(self, sftp, file_path: str, data: str | Iterable[str]):
+        with sftp.open(file_path, mode='wb') as f:
+            self._sftp_write_chunks(f, data)
+
+    def _sftp_write_chunks(self, f, data: str | Iterable[str]):
+        f.set_pipelined(True)
+        for _chunk in self._iter_chunks(data):
+            f.write(_chunk)
+
 
 class FileHandler(NetFileHandle):
     """
@@ -55,6 +180,9 @@ class FileHandler(NetFileHandle):
             ssh_port: str,
             username: str,
             password: str,
+            pool: SSHConnectPool | None = None,
+            transfer_mode: str = 'shell',
+            chunk_size: int = 32768
     ):
         """
         :param file_path: 文件路径，绝对路径，必传参数
@@ -62,8 +190,11 @@ class FileHandler(NetFileHandle):
         :param ssh_port: 远程文件操作参数，ssh 协议端口
         :param username: 远程文件操作参数，文件所属用户
         :param password: 远程文件操作参数，文件所属用户的密码
+        :param pool: 远程文件操作参数，SSH 连接池，不传则每次新建连接
+        :param transfer_mode: 远程文件操作参数，文件传输方式：shell（echo 写入）或 sftp（分块流式传输，原子替换）
+        :param chunk_size: 远程文件操作参数，sftp 传输方式下每次写入的字节数
         """
-        super().__init__(host, ssh_port, username, password, file_path)
+        super().__init__(host, ssh_port, username, password, file_path, pool, transfer_mode, chunk_size)
 
     def backup(self, backup_file_name: str | None = None):
         """
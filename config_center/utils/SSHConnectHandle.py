@@ -1,7 +1,12 @@
 import re
-from typing import NoReturn
+import time
+import hashlib
+import threading
+from typing import NoReturn, Dict, List, Tuple
 import paramiko
 
+from utils import metrics
+
 
 class CommandExecError(Exception):
     pass
@@ -11,6 +16,10 @@ class HighRiskCommandError(Exception):
     pass
 
 
+class SSHConnectPoolTimeoutError(Exception):
+    pass
+
+
 high_risk_commands_res = (
     r'^rm -[a-z|A-Z]*r[a-z|A-Z]* \*',
     r'^rm -[a-z|A-Z]*r[a-z|A-Z]* /*/\*',
@@ -22,6 +31,219 @@ def null_debug_log_handle(log_content: str):
     pass
 
 
+class SSHConnectPool:
+    """
+    进程级 SSH 连接池，按 (host, port, username) 复用已认证的连接
+
+    - 密码摘要也参与连接键，密码不一致的请求不会复用他人已认证的连接
+    - 空闲超过 idle_timeout 的连接会被关闭：有空闲连接时由后台线程定期清理，acquire、release、stats 时也会清理
+    - 取出空闲连接时先做健康检查，失效的连接直接丢弃并重新建连
+    - 同一 host 的连接总数（使用中 + 空闲）不超过 max_per_host，超出时等待其他连接归还
+    """
+    def __init__(
+            self,
+            max_per_host: int = 4,
+            idle_timeout: float = 300,
+            connect_timeout: float = 10,
+            acquire_timeout: float = 60,
+            debug_log_handle=null_debug_log_handle
+    ):
+        """
+        :param max_per_host: 单个 host 允许同时存在的连接数上限
+        :param idle_timeout: 空闲连接的保留时长，单位：秒
+        :param connect_timeout: 建立连接的超时时间，单位：秒
+        :param acquire_timeout: 连接数达到上限时，等待其他连接归还的超时时间，单位：秒
+        """
+        self._max_per_host = max_per_host
+        self._idle_timeout = idle_timeout
+        self._connect_timeout = connect_timeout
+        self._acquire_timeout = acquire_timeout
+        self._debug_log_handle = debug_log_handle
+        self._cond = threading.Condition()
+        # 空闲连接：连接键 -> [(连接, 归还时间)]
+        self._idle: Dict[Tuple, List[Tuple[paramiko.SSHClient, float]]] = {}
+        # 使用中的连接数：host -> 数量
+        self._in_use: Dict[str, int] = {}
+        # 使用中的连接对应的连接键：id(连接) -> 连接键
+        self._leased: Dict[int, Tuple] = {}
+        # 清理空闲连接的后台线程，有空闲连接时启动，空闲连接清空后退出
+        self._reaper: threading.Thread | None = None
+        self._created = 0
+        self._reused = 0
+        self._closed = 0
+
+    def acquire(self, host: str, port: str | int, username: str, password: str) -> paramiko.SSHClient:
+        _key = (host, int(port), username, hashlib.sha256(password.encode('utf-8')).hexdigest())
+        _deadline = time.monotonic() + self._acquire_timeout
+        _to_close = []
+        with self._cond:
+            while True:
+                _to_close.extend(self._pop_expired())
+                _client = None
+                if self._idle.get(_key):
+                    _client = self._idle[_key].pop()[0]
+                    break
+                if self._host_total(host) >= self._max_per_host:
+                    # 该 host 的空闲连接属于其他用户时，关闭一个腾出名额
+                    _other = self._pop_idle_of_host(host)
+                    if _other is None:
+                        _remaining = _deadline - time.monotonic()
+                        if _remaining <= 0:
+                            raise SSHConnectPoolTimeoutError(
+                                f'Waiting for ssh connection timeout: {username}@{host}:{port}')
+                        self._cond.wait(_remaining)
+                        continue
+                    _to_close.append(_other)
+                break
+            self._in_use[host] = self._in_use.get(host, 0) + 1
+
+        for _c in _to_close:
+            self._close(_c)
+
+        try:
+            if _client is not None and not self._is_healthy(_client):
+                self._close(_client)
+                _client = None
+            if _client is None:
+                _client = self._connect(host, port, username, password)
+                with self._cond:
+                    self._created += 1
+            else:
+                self._debug_log_handle(f'复用连接：{_client}')
+                with self._cond:
+                    self._reused += 1
+        except BaseException:
+            with self._cond:
+                self._in_use[host] -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._leased[id(_client)] = _key
+        return _client
+
+    def release(self, client: paramiko.SSHClient, broken: bool = False) -> NoReturn:
+        """
+        :param client: acquire 取出的连接
+        :param broken: 连接在使用过程中出现异常时传 True，该连接将被关闭而不是放回连接池
+        """
+        with self._cond:
+            _key = self._leased.pop(id(client), None)
+            if _key is None:
+                return
+            self._in_use[_key[0]] -= 1
+            _to_close = self._pop_expired()
+            if broken:
+                _to_close.append(client)
+            else:
+                self._idle.setdefault(_key, []).append((client, time.monotonic()))
+                self._start_reaper()
+            self._cond.notify_all()
+        for _c in _to_close:
+            self._close(_c)
+
+    def reap(self) -> int:
+        """
+        关闭空闲超过 idle_timeout 的连接
+        :return: 关闭的连接数
+        """
+        with self._cond:
+            _expired = self._pop_expired()
+            if _expired:
+                self._cond.notify_all()
+        for _c in _expired:
+            self._close(_c)
+        return len(_expired)
+
+    def close_all(self) -> NoReturn:
+        with self._cond:
+            _clients = [_c for _v in self._idle.values() for _c, _ in _v]
+            self._idle.clear()
+        for _c in _clients:
+            self._close(_c)
+
+    def stats(self) -> dict:
+        self.reap()
+        with self._cond:
+            _idle = sum(len(_v) for _v in self._idle.values())
+            _in_use = sum(self._in_use.values())
+            return {
+                'open': _idle + _in_use,
+                'idle': _idle,
+                'in_use': _in_use,
+                'created': self._created,
+                'reused': self._reused,
+                'closed': self._closed,
+            }
+
+    def _start_reaper(self) -> NoReturn:
+        # 调用方需持有 self._cond
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, name='ssh-pool-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self) -> NoReturn:
+        while True:
+            time.sleep(max(self._idle_timeout / 2, 1))
+            self.reap()
+            with self._cond:
+                if not self._idle:
+                    self._reaper = None
+                    return
+
+    def _host_total(self, host: str) -> int:
+        return self._in_use.get(host, 0) + sum(len(_v) for _k, _v in self._idle.items() if _k[0] == host)
+
+    def _pop_idle_of_host(self, host: str) -> paramiko.SSHClient | None:
+        for _k, _v in self._idle.items():
+            if _k[0] == host and _v:
+                return _v.pop(0)[0]
+        return None
+
+    def _pop_expired(self) -> List[paramiko.SSHClient]:
+        _expired = []
+        _now = time.monotonic()
+        for _k in list(self._idle):
+            _alive = []
+            for _c, _t in self._idle[_k]:
+                if _now - _t > self._idle_timeout:
+                    _expired.append(_c)
+                else:
+                    _alive.append((_c, _t))
+            if _alive:
+                self._idle[_k] = _alive
+            else:
+                del self._idle[_k]
+        return _expired
+
+    def _connect(self, host: str, port: str | int, username: str, password: str) -> paramiko.SSHClient:
+        _client = paramiko.SSHClient()
+        _client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        with metrics.timer(metrics.ssh_operation_duration, operation='connect'):
+            _client.connect(host, port=port, username=username, password=password, timeout=self._connect_timeout)
+        self._debug_log_handle(f'连接已建立：{_client}')
+        return _client
+
+    @staticmethod
+    def _is_healthy(client: paramiko.SSHClient) -> bool:
+        _transport = client.get_transport()
+        if _transport is None or not _transport.is_active() or not _transport.is_authenticated():
+            return False
+        try:
+            _transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+    def _close(self, client: paramiko.SSHClient) -> NoReturn:
+        self._debug_log_handle(f'关闭连接：{client}')
+        try:
+            client.close()
+        finally:
+            with self._cond:
+                self._closed += 1
+
+
 class SSHConnectHandle:
     def __init__(
             self,
@@ -29,22 +251,35 @@ class SSHConnectHandle:
             port: str | int,
             username: str,
             password: str,
-            debug_log_handle=null_debug_log_handle
+            debug_log_handle=null_debug_log_handle,
+            pool: SSHConnectPool | None = None
     ):
+        """
+        :param pool: SSH 连接池，传入时从连接池获取连接，close_connect 时归还到连接池
+        """
         self._debug_log_handle = debug_log_handle
-        self._ssh_handle = paramiko.SSHClient()
-        self._ssh_handle.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        self._ssh_handle.connect(host, port=port, username=username, password=password)
-        self._debug_log_handle(f'连接已建立：{self._ssh_handle}')
+        self._pool = pool
+        self._is_broken = False
+        self._sftp_handle = None
+        if pool is not None:
+            self._ssh_handle = pool.acquire(host, port, username, password)
+        else:
+            self._ssh_handle = paramiko.SSHClient()
+            self._ssh_handle.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            with metrics.timer(metrics.ssh_operation_duration, operation='connect'):
+                self._ssh_handle.connect(host, port=port, username=username, password=password)
+            self._debug_log_handle(f'连接已建立：{self._ssh_handle}')
 
     def exec_command(
             self,
             command: str,
-            is_return_stdout: bool = False
+            is_return_stdout: bool = False,
+            get_pty: bool = True
     ) -> str:
         """
         :param command: Linux command
         :param is_return_stdout: 是否返回 stdout，默认不返回
+        :param get_pty: 是否申请伪终端，默认申请
         :return: stdout
         """
         for _r in high_risk_commands_res:
@@ -52,18 +287,55 @@ class SSHConnectHandle:
                 raise HighRiskCommandError(f'High Risk Command, forbidden exec: {command}')
 
         self._debug_log_handle(f'执行命令：{command}')
-        stdin, stdout, stderr = self._ssh_handle.exec_command(command, get_pty=True)
-        stderr_list = stderr.readlines()
-        stdout_str = stdout.read().decode('utf-8')
+        try:
+            with metrics.timer(metrics.ssh_operation_duration, operation='exec'):
+                stdin, stdout, stderr = self._ssh_handle.exec_command(command, get_pty=get_pty)
+                stderr_list = stderr.readlines()
+                stdout_str = stdout.read().decode('utf-8')
+                _exit_status = stdout.channel.recv_exit_status()
+        except Exception:
+            # 传输层异常的连接不能再放回连接池
+            self._is_broken = True
+            raise
         self._debug_log_handle(f'\nstdout: \n{stdout_str}')
         self._debug_log_handle(f'\nstderr: \n{stderr_list}')
 
-        if stdout.channel.recv_exit_status() != 0:
+        if _exit_status != 0:
             raise CommandExecError(f'\nstdout: {stdout_str}\nstderr: {stderr_list}')
         else:
             if is_return_stdout:
                 return stdout_str
 
+    def open_sftp(self) -> paramiko.SFTPClient:
+        """
+        在当前连接上打开 SFTP 会话，同一个 handle 内复用，close_connect 时关闭
+        """
+        if self._sftp_handle is None:
+            try:
+                self._sftp_handle = self._ssh_handle.open_sftp()
+            except Exception:
+                self._is_broken = True
+                raise
+        return self._sftp_handle
+
+    def mark_broken(self) -> NoReturn:
+        """
+        标记连接已损坏，close_connect 时关闭连接而不是放回连接池
+        """
+        self._is_broken = True
+
     def close_connect(self) -> NoReturn:
-        self._debug_log_handle(f'关闭连接：{self._ssh_handle}')
-        self._ssh_handle.close()
+        if self._ssh_handle is None:
+            return
+        if self._sftp_handle is not None:
+            try:
+                self._sftp_handle.close()
+            except Exception:
+                self._is_broken = True
+            self._sftp_handle = None
+        if self._pool is not None:
+            self._pool.release(self._ssh_handle, broken=self._is_broken)
+        else:
+            self._debug_log_handle(f'关闭连接：{self._ssh_handle}')
+            self._ssh_handle.close()
+        self._ssh_handle = None
@@ -1,7 +1,14 @@
+import os
+import hashlib
+import threading
 from datetime import datetime
 from typing import Union
 import jinja2
 
+import ini
+from utils.lru_cache import NamespaceLRUCache, MISSING
+from utils import metrics
+
 
 class JinjaCustomizedFilters:
     @classmethod
@@ -74,12 +81,99 @@ class JinjaCustomizedFilters:
             return convert_to_format(time_str, time_str_format, format_str)
 
 
+class _CountingBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """
+    统计磁盘字节码缓存命中情况的 FileSystemBytecodeCache
+    """
+    def __init__(self, directory: str):
+        super().__init__(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def load_bytecode(self, bucket: jinja2.bccache.Bucket) -> None:
+        super().load_bytecode(bucket)
+        if bucket.code is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+
 class JinjaHandler:
     _jinja_env = jinja2.Environment()
     JinjaCustomizedFilters.add_filters(_jinja_env)
+    # 已编译模板的 LRU 缓存，以模板内容的摘要为键，相同内容只解析编译一次
+    _compiled_cache = NamespaceLRUCache(max_size=int(ini.jinja_cache_max_size), ttl=float('inf'))
+    # 模板文件专用的 Environment，按需创建：通过 loader 加载模板文件（文件修改后自动重新加载），编译结果缓存到磁盘
+    _file_env: jinja2.Environment | None = None
+    _file_env_lock = threading.Lock()
 
     @classmethod
     def render(cls, row: str, **env) -> str:
-        _template = cls._jinja_env.from_string(row)
-        return _template.render(**env)
+        if not isinstance(row, str):
+            # 非字符串内容（如 None）交由 jinja 处理，保持原有的异常行为
+            return cls._jinja_env.from_string(row).render(**env)
+        with metrics.timer(metrics.jinja_render_duration, kind='string', namespace='', template=''):
+            _digest = hashlib.sha1(row.encode('utf-8')).hexdigest()
+            _template = cls._compiled_cache.get('', _digest)
+            if _template is MISSING:
+                _template = cls._jinja_env.from_string(row)
+                cls._compiled_cache.set('', _digest, _template)
+            return _template.render(**env)
+
+    @classmethod
+    def parse(cls, source: str) -> jinja2.nodes.Template:
+        """
+        使用渲染所用的 Environment 解析内容，不编译，用于静态分析模板
+        :return: 模板的抽象语法树
+        :raise jinja2.TemplateSyntaxError: 内容存在语法错误
+        """
+        return cls._jinja_env.parse(source)
+
+    @classmethod
+    def get_file_template(cls, template_path: str) -> jinja2.Template:
+        """
+        :param template_path: 模板文件相对于资源库基目录的路径，以 / 分隔
+        """
+        if cls._file_env is None:
+            with cls._file_env_lock:
+                if cls._file_env is None:
+                    os.makedirs(ini.jinja_bytecode_cache_path, exist_ok=True)
+                    _file_env = jinja2.Environment(
+                        loader=jinja2.FileSystemLoader(ini.resources_path, encoding='utf-8'),
+                        bytecode_cache=_CountingBytecodeCache(ini.jinja_bytecode_cache_path),
+                        cache_size=int(ini.jinja_cache_max_size),
+                        auto_reload=True
+                    )
+                    JinjaCustomizedFilters.add_filters(_file_env)
+                    cls._file_env = _file_env
+        return cls._file_env.get_template(template_path)
+
+    @classmethod
+    def render_file(cls, template_path: str, **env) -> str:
+        # 模板文件路径为 {namespace}/templates/{template_name}
+        _namespace, _, _template_name = template_path.partition('/templates/')
+        with metrics.timer(
+                metrics.jinja_render_duration,
+                kind='file',
+                namespace=metrics.namespace_label(_namespace),
+                template=metrics.template_label(_template_name)
+        ):
+            return cls.get_file_template(template_path).render(**env)
+
+    @classmethod
+    def stats(cls) -> dict:
+        _string_stats = cls._compiled_cache.stats()
+        _bytecode_cache = cls._file_env.bytecode_cache if cls._file_env is not None else None
+        return {
+            'string_templates': {
+                'size': _string_stats['size'],
+                'max_size': _string_stats['max_size'],
+                'hits': _string_stats['hits'],
+                'misses': _string_stats['misses']
+            },
+            'file_templates_bytecode': {
+                'hits': _bytecode_cache.hits if _bytecode_cache else 0,
+                'misses': _bytecode_cache.misses if _bytecode_cache else 0
+            }
+        }
 
@@ -1,22 +1,51 @@
+import io
 import re
-from typing import Optional
+from typing import Optional, Iterable, Iterator, NamedTuple
+
+
+class KVLine(NamedTuple):
+    """
+    k=v 内容中的一行：配置行 key、value 有值，comment 为 None；注释行、空行及无法识别的行 key、value 为 None，comment 为原始内容
+    """
+    key: Optional[str]
+    value: Optional[str]
+    comment: Optional[str] = None
 
 
 # k=v 格式配置文件内容解析器
 class KVFileContentAnalyzer:
+    # 配置键由字母、数字及 . _ - @ 组成，第一个等号之后的全部内容（包括等号）均为配置值
+    _line_re = re.compile(r'([A-Za-z0-9._@-]+)=(.*)')
+
     @staticmethod
     def parse(row: str) -> dict:
-        config_content_list = row.strip('\n').split('\n')
-        config_dict = {}
-        config_re = r'^([a-z]|[A-Z]|\.|_|-|[0-9]|@)*=\S*'
-        for cc in config_content_list:
-            if re.search(config_re, cc):
-                config_key = cc.split('=')[0]
-                config_value = cc.split('=')[1]
-            else:
-                continue
-            config_dict[config_key] = config_value
-        return config_dict
+        """
+        解析整段内容，配置键重复时以最后一行为准；逐行迭代的输入及需要保留注释时使用 iter_parse
+        """
+        _match = KVFileContentAnalyzer._line_re.fullmatch
+        return {_m[1]: _m[2] for _m in map(_match, row.replace('\r\n', '\n').split('\n')) if _m is not None}
+
+    @staticmethod
+    def iter_parse(
+            content: str | Iterable[str],
+            keep_comments: bool = False
+    ) -> Iterator[KVLine]:
+        """
+        parse 的流式版本，逐行解析内容
+        :param content: 字符串，或逐行迭代的对象（如文件对象）
+        :param keep_comments: 是否同时生成注释行、空行及无法识别的行，用于原样写回
+        :return:
+        """
+        if isinstance(content, str):
+            content = io.StringIO(content)
+        _match = KVFileContentAnalyzer._line_re.fullmatch
+        for _line in content:
+            _line = _line.rstrip('\r\n')
+            _m = _match(_line)
+            if _m is not None:
+                yield KVLine(_m[1], _m[2])
+            elif keep_comments:
+                yield KVLine(None, None, _line)
 
     @staticmethod
     def unparse(
@@ -30,11 +59,30 @@ class KVFileContentAnalyzer:
         :param annotation_dict: 注释字典，本字典中的 key 与 serialized_data 中的 key 要统一
         :return:
         """
-        _content = ''
+        if annotation_dict is None:
+            annotation_dict = {}
+        return ''.join(KVFileContentAnalyzer.iter_unparse(
+            map(lambda _k: (_k, parsed_data[_k], annotation_dict.get(_k)), parsed_data),
+            indent=indent
+        ))
+
+    @staticmethod
+    def iter_unparse(
+            rows: Iterable[tuple],
+            indent: int = 0
+    ) -> Iterator[str]:
+        """
+        unparse 的流式版本，逐条生成内容
+        :param rows: (key, value) 或 (key, value, annotation) 元组，annotation 为 None 时不生成注释行；
+            key 为 None 的行（即 iter_parse 生成的注释行、空行）原样输出 annotation
+        :param indent: 等号两边的空隔，以空格符分隔，需要多少个空格在等号两边就传入对应的数字
+        :return:
+        """
         _indent_content = ' ' * indent
-        for _key in parsed_data:
-            try:
-                _content += f'# {annotation_dict[_key]}\n{_key}{_indent_content}={_indent_content}{parsed_data[_key]}\n'
-            except (KeyError, TypeError):
-                _content += f'{_key}{_indent_content}={_indent_content}{parsed_data[_key]}\n'
-        return _content
+        for _row in rows:
+            if _row[0] is None:
+                yield f'{_row[2]}\n'
+            elif len(_row) > 2 and _row[2] is not None:
+                yield f'# {_row[2]}\n{_row[0]}{_indent_content}={_indent_content}{_row[1]}\n'
+            else:
+                yield f'{_row[0]}{_indent_content}={_indent_content}{_row[1]}\n'
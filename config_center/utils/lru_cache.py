@@ -0,0 +1,107 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Dict, Set
+
+
+# 缓存未命中时的返回标记（缓存值本身可能为 None，不能用 None 表示未命中）
+MISSING = object()
+
+
+class NamespaceLRUCache:
+    """
+    按 namespace 分区的内存缓存，带容量上限（LRU 淘汰）和过期时间（TTL）
+
+    每个 namespace 维护一个代数（generation），失效操作会递增代数；
+    读取方在查库前记录代数，写入缓存时代数已变化则放弃写入，避免并发写入后把旧数据放回缓存
+    """
+    def __init__(self, max_size: int, ttl: float):
+        """
+        :param max_size: 缓存条目上限，小于等于 0 时不缓存任何数据
+        :param ttl: 缓存条目的有效期，单位：秒，小于等于 0 时不缓存任何数据
+        """
+        self._max_size = max_size
+        self._ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._namespace_keys: Dict[str, Set[Hashable]] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_size > 0 and self._ttl > 0
+
+    def generation(self, namespace: str) -> int:
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def get(self, namespace: str, key: Hashable) -> Any:
+        with self._lock:
+            _item = self._data.get((namespace, key))
+            if _item is None:
+                self.misses += 1
+                return MISSING
+            _expire_at, _value = _item
+            if _expire_at < time.monotonic():
+                self._pop((namespace, key))
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end((namespace, key))
+            self.hits += 1
+            return _value
+
+    def set(self, namespace: str, key: Hashable, value: Any, generation: int | None = None) -> None:
+        """
+        :param generation: 读取数据前通过 generation() 获取的代数，如与当前代数不一致，说明期间发生过失效，放弃写入
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generations.get(namespace, 0):
+                return
+            self._data[(namespace, key)] = (time.monotonic() + self._ttl, value)
+            self._data.move_to_end((namespace, key))
+            self._namespace_keys.setdefault(namespace, set()).add(key)
+            while len(self._data) > self._max_size:
+                self._pop(next(iter(self._data)))
+
+    def invalidate(self, namespace: str, *keys: Hashable) -> None:
+        """
+        :param namespace: 失效的 namespace
+        :param keys: 需要失效的缓存键，不传则失效整个 namespace
+        """
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            if keys:
+                for _k in keys:
+                    self._pop((namespace, _k))
+            else:
+                for _k in self._namespace_keys.pop(namespace, set()):
+                    self._data.pop((namespace, _k), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            for _ns in list(self._namespace_keys):
+                self._generations[_ns] = self._generations.get(_ns, 0) + 1
+            self._data.clear()
+            self._namespace_keys.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'max_size': self._max_size,
+                'ttl': self._ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _pop(self, cache_key: tuple) -> None:
+        if self._data.pop(cache_key, None) is not None:
+            _keys = self._namespace_keys.get(cache_key[0])
+            if _keys is not None:
+                _keys.discard(cache_key[1])
+                if not _keys:
+                    del self._namespace_keys[cache_key[0]]
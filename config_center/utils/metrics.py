@@ -0,0 +1,135 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import Metric
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import ini
+
+
+class LabelGuard:
+    """
+    标签取值的基数保护：记录出现过的取值，超过上限后新出现的取值统一记为 other，防止时间序列无限增长
+    """
+    overflow_value = 'other'
+
+    def __init__(self, max_values: int):
+        self._max_values = max_values
+        self._values = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, value: str | None) -> str:
+        if value is None:
+            return ''
+        if value in self._values:
+            return value
+        with self._lock:
+            if len(self._values) < self._max_values:
+                self._values.add(value)
+                return value
+        return self.overflow_value
+
+
+class _CallbackCollector:
+    """
+    采集时调用回调函数生成指标，用于导出各组件自行统计的数据（如缓存命中数）
+    """
+    def __init__(self, callback: Callable[[], Iterable[Metric]]):
+        self._callback = callback
+
+    def collect(self) -> Iterable[Metric]:
+        return self._callback()
+
+
+registry = CollectorRegistry()
+namespace_label = LabelGuard(int(ini.metrics_max_label_values))
+template_label = LabelGuard(int(ini.metrics_max_label_values))
+
+http_request_duration = Histogram(
+    'snow_cc_http_request_duration_seconds',
+    'HTTP request latency by route',
+    ['method', 'route', 'status', 'namespace'],
+    registry=registry
+)
+sql_query_duration = Histogram(
+    'snow_cc_sql_query_duration_seconds',
+    'SQL statement execution time by statement type',
+    ['operation'],
+    registry=registry
+)
+jinja_render_duration = Histogram(
+    'snow_cc_jinja_render_duration_seconds',
+    'Jinja render time; kind is string (config values, destination fields) or file (template files)',
+    ['kind', 'namespace', 'template'],
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5),
+    registry=registry
+)
+ssh_operation_duration = Histogram(
+    'snow_cc_ssh_operation_duration_seconds',
+    'SSH operation time; operation is connect, exec or transfer',
+    ['operation'],
+    registry=registry
+)
+deploy_total = Counter(
+    'snow_cc_deploy',
+    'Template deploy outcomes',
+    ['namespace', 'template', 'status'],
+    registry=registry
+)
+deploy_duration = Histogram(
+    'snow_cc_deploy_duration_seconds',
+    'Template render and publish time',
+    ['namespace', 'template'],
+    registry=registry
+)
+registry_rows_total = Counter(
+    'snow_cc_registry_rows',
+    'Rows synchronized by namespace registration',
+    ['namespace', 'table', 'change'],
+    registry=registry
+)
+
+
+@contextmanager
+def timer(histogram: Histogram, **labels) -> Iterator[None]:
+    """
+    记录代码块的执行耗时，代码块抛出异常时同样记录
+    """
+    _start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - _start)
+
+
+def register_collector(callback: Callable[[], Iterable[Metric]]) -> None:
+    registry.register(_CallbackCollector(callback))
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    通过游标事件记录 engine 上每条 SQL 语句的执行耗时，异步引擎传入其 sync_engine
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('snow_cc_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        _start = conn.info['snow_cc_query_start'].pop()
+        _operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+        sql_query_duration.labels(operation=_operation).observe(time.perf_counter() - _start)
+
+    @event.listens_for(engine, 'handle_error')
+    def _handle_error(exception_context):
+        # 执行失败的语句不会触发 after_cursor_execute，丢弃其开始时间
+        _connection = exception_context.connection
+        if _connection is not None and _connection.info.get('snow_cc_query_start'):
+            _connection.info['snow_cc_query_start'].pop()
+
+
+def generate() -> bytes:
+    return generate_latest(registry)
@@ -1,126 +1,253 @@
 import os
-import re
-from typing import List, Dict, Tuple
+import csv
+import threading
+from typing import List, Dict, Tuple, Callable, Any, Iterable, NamedTuple, Type, TypeVar
+from jinja2 import TemplateNotFound
 
 import ini
 from errors import CcTemplateNotFoundError, CcMetaIllegalError, CcResourcesError
+from utils.jinja_handler import JinjaHandler
+
+
+# 元数据文件格式
+format_directory = {
+    'tsv': {
+        'column_split': '\t'
+    }
+}
+# cc_configs_meta 中 level 字段的合法值
+config_meta_levels = frozenset(('default', 'customized', 'default_overload'))
+
+
+class ConfigMeta(NamedTuple):
+    key: str
+    value: str
+    description: str
+    level: str
+    category: str
+    # 记录在文件中的起始行号
+    line: int = 0
+
+
+class TemplateMeta(NamedTuple):
+    template_name: str
+    dest_address: str
+    dest_path: str
+    dest_user: str
+    dest_passwd: str
+    # 记录在文件中的起始行号
+    line: int = 0
+
+
+MetaRecord = TypeVar('MetaRecord', ConfigMeta, TemplateMeta)
+
+
+def _validate_config_meta(record: ConfigMeta) -> None:
+    if record.level not in config_meta_levels:
+        raise CcMetaIllegalError(f'illegal level value: {record.level}, key: {record.key}')
 
 
 # 元数据操作类
 class ResourcesHandle:
+    # 资源缓存：缓存键（文件路径等） -> (签名, 读取或解析结果)
+    _cache: Dict[str, Tuple[tuple, Any]] = {}
+    _cache_lock = threading.Lock()
+
     @classmethod
-    def _analysis_data_content(cls, data_content: str, file_format: str) -> List[Dict]:
+    def _analysis_data_content(
+            cls,
+            lines: Iterable[str],
+            file_format: str,
+            record_type: Type[MetaRecord],
+            source: str = '',
+            validator: Callable[[MetaRecord], None] | None = None
+    ) -> List[MetaRecord]:
         """
-        默认数据文件中第一行为表头
-        :param data_content:
-        :param file_format:
-        :return:
+        单次遍历解析元数据文件，第一行为表头，逐行构建记录并校验，不整体读入文件内容
+        - 字段可用双引号包裹，包裹的字段内可包含列分隔符（制表符）及换行，字段内的双引号以两个双引号表示
+        - 空白行被忽略；表头缺少记录所需的列、数据行列数少于表头或校验失败时，抛出带行号的 CcMetaIllegalError
+        :param lines: 文件内容的行迭代器（打开文件时需指定 newline=''）
+        :param record_type: 记录类型，表头中需包含其全部字段，多余的列被忽略
+        :param source: 文件来源，用于错误信息
+        :param validator: 记录校验函数，校验失败时抛出 CcResourcesError，错误信息中会补充行号
         """
-        format_directory = {
-            'tsv': {
-                'line_split': '\n',
-                'column_split': '\t'
-            }
-        }
-        # 读取文件格式化信息
-        _format = format_directory[file_format]
-
-        content_list = []
-        # 切分输入字符串并过滤空白行
-        for _ in data_content.split(_format['line_split']):
-            if not re.search(r'^\s+$', _) and _:
-                content_list.append(_)
-
-        # 读取表头信息
-        columns_list = content_list[0].strip('\n').strip(' ').strip('\r').split(_format['column_split'])
-        # 读取并构建数据
+        try:
+            _format = format_directory[file_format]
+        except KeyError:
+            raise CcMetaIllegalError(f'{source}: unsupported meta file format: {file_format}')
+
+        _reader = csv.reader(lines, delimiter=_format['column_split'], quotechar='"', doublequote=True, strict=True)
+        _columns = None
+        _indexes = None
+        _fields = [_f for _f in record_type._fields if _f != 'line']
         rows = []
-        for line in content_list[1:]:
-            row = line.strip('\n').strip(' ').strip('\r').split(_format['column_split'])
-            _ = {}
-            for _c_index in range(len(columns_list)):
-                _[columns_list[_c_index]] = row[_c_index]
-            rows.append(_)
+        _line = 1
+        try:
+            for _row in _reader:
+                # 当前记录的起始行号，被引号包裹的字段可能跨行
+                _start_line, _line = _line, _reader.line_num + 1
+                if not _row or all(not _c.strip() for _c in _row):
+                    continue
+                # 与此前一致，去除行首尾的空格及回车
+                _row[0] = _row[0].lstrip(' ')
+                _row[-1] = _row[-1].rstrip(' \r')
 
+                if _columns is None:
+                    _columns = _row
+                    _missing = [_f for _f in _fields if _f not in _columns]
+                    if _missing:
+                        raise CcMetaIllegalError(
+                            f'{source}:{_start_line}: header is missing columns: {", ".join(_missing)}')
+                    _indexes = [_columns.index(_f) for _f in _fields]
+                    continue
+
+                if len(_row) < len(_columns):
+                    raise CcMetaIllegalError(
+                        f'{source}:{_start_line}: expected {len(_columns)} columns, got {len(_row)}: {_row}')
+                _record = record_type(*(_row[_i] for _i in _indexes), line=_start_line)
+                if validator is not None:
+                    try:
+                        validator(_record)
+                    except CcResourcesError as e:
+                        raise type(e)(f'{source}:{_start_line}: {e}')
+                rows.append(_record)
+        except csv.Error as e:
+            raise CcMetaIllegalError(f'{source}:{_reader.line_num}: {e}')
+        if _columns is None:
+            raise CcMetaIllegalError(f'{source}: header not found')
         return rows
 
+    @classmethod
+    def _load_meta_file(
+            cls,
+            resource: Dict,
+            record_type: Type[MetaRecord],
+            validator: Callable[[MetaRecord], None] | None = None
+    ) -> List[MetaRecord]:
+        with open(resource['path'], mode='r', encoding='utf-8', newline='') as f:
+            return cls._analysis_data_content(f, resource['format'], record_type, resource['path'], validator)
+
+    @classmethod
+    def _cached(cls, cache_key: str, signature: tuple, loader: Callable[[], Any]) -> Any:
+        """
+        以签名校验的内存缓存，签名（文件的 mtime 及大小）未变化时直接返回缓存，否则重新加载
+        """
+        with cls._cache_lock:
+            _item = cls._cache.get(cache_key)
+        if _item is not None and _item[0] == signature:
+            return _item[1]
+        _value = loader()
+        with cls._cache_lock:
+            cls._cache[cache_key] = (signature, _value)
+        return _value
+
+    @staticmethod
+    def _signature(stat_result: os.stat_result) -> tuple:
+        return stat_result.st_mtime_ns, stat_result.st_size
+
+    @staticmethod
+    def _read_file(path: str) -> str:
+        with open(path, mode='r', encoding='utf-8') as f:
+            return f.read()
+
+    @classmethod
+    def _scan_resource_dir(cls, resource_base_path: str) -> Dict[str, Dict]:
+        """
+        收集 resources 目录内容：文件以去掉后缀的文件名为键，记录文件名及格式；目录以目录名为键
+        """
+        _resources = {}
+        with os.scandir(resource_base_path) as it:
+            for _e in it:
+                if _e.is_dir():
+                    _resources[_e.name] = {'path': _e.path, 'is_dir': True}
+                else:
+                    try:
+                        _format = _e.name.split('.')[1]
+                    except IndexError:
+                        _format = ''
+                    _resources[_e.name.split('.')[0]] = {'path': _e.path, 'is_dir': False, 'format': _format}
+        return _resources
+
     # 获取库数据
     @classmethod
     def get_library_data(
             cls,
             namespace: str,
-    ) -> Tuple[List[Dict], List[Dict], str]:
+    ) -> Tuple[List[ConfigMeta], List[TemplateMeta], str]:
+        """
+        资源文件按 mtime 及大小缓存，仅重新读取、解析发生变化的文件，全部文件未变化时直接返回缓存的校验结果；
+        返回的数据为缓存共享对象，调用方不可修改
+        """
         resource_base_path = os.path.join(ini.resources_path, namespace)
-        # 收集 resources 目录内容
+        # 收集 resources 目录内容，目录的 mtime 仅在增删文件时变化
         try:
-            resource_file_list = os.listdir(resource_base_path)
+            _resources = cls._cached(
+                resource_base_path,
+                cls._signature(os.stat(resource_base_path)),
+                lambda: cls._scan_resource_dir(resource_base_path)
+            )
         except FileNotFoundError:
             raise CcResourcesError(f'Resource path not found! namespace: {namespace}')
-        _resources = {}
-        for _ in resource_file_list:
-            if os.path.isdir(os.path.join(resource_base_path, _)):
-                _resources[_] = os.listdir(os.path.join(resource_base_path, _))
-            else:
-                with open(os.path.join(resource_base_path, _), mode='r', encoding='utf-8') as f:
-                    _s = f.read()
-                try:
-                    _resources[_.split('.')[0]] = {'content': _s, 'format': _.split('.')[1]}
-                except IndexError:
-                    _resources[_.split('.')[0]] = {'content': _s, 'format': ''}
-
-        # 读取 VERSION
-        try:
-            version = _resources['VERSION']['content']
-        except KeyError:
-            raise CcResourcesError(f"Resource file: [VERSION] not found.")
 
-        # 读取 cc_configs_meta
-        try:
-            _ = _resources['cc_configs_meta']
-        except KeyError:
-            raise CcResourcesError(f"Resource file: [cc_configs_meta] not found.")
-        _cc_configs_meta = cls._analysis_data_content(_['content'], _['format'])
-        # 校验数据
-        for _ in _cc_configs_meta:
-            # 检查 level 字段值
-            if _['level'] not in ['default', 'customized', 'default_overload']:
-                raise CcMetaIllegalError(f'ERROR: The column value is illegal in meta data：{_}')
-
-        # 读取 cc_templates_meta
-        try:
-            _ = _resources['cc_templates_meta']
-        except KeyError:
-            raise CcResourcesError(f"Resource file: [cc_templates_meta] not found.")
-        try:
-            _templates_list = _resources['templates']
-        except KeyError:
-            raise CcResourcesError(f"Resource path: [templates] not found.")
-        _cc_templates_meta = cls._analysis_data_content(_['content'], _['format'])
-        # 校验数据
-        for _ in _cc_templates_meta:
-            # 检查数据中的template文件是否真实存在
-            if _['template_name'] not in _templates_list:
-                raise CcTemplateNotFoundError(
-                    f"Template file not found! namespace: {namespace}, template: {_}, template list: {_templates_list}")
+        def _stat(name: str, error_message: str) -> Tuple[Dict, tuple]:
+            try:
+                _r = _resources[name]
+                return _r, cls._signature(os.stat(_r['path']))
+            except (KeyError, FileNotFoundError):
+                raise CcResourcesError(error_message)
+
+        _version, _version_sig = _stat('VERSION', f"Resource file: [VERSION] not found.")
+        _configs_meta, _configs_meta_sig = _stat('cc_configs_meta', f"Resource file: [cc_configs_meta] not found.")
+        _templates_meta, _templates_meta_sig = _stat(
+            'cc_templates_meta', f"Resource file: [cc_templates_meta] not found.")
+        _templates, _templates_sig = _stat('templates', f"Resource path: [templates] not found.")
+
+        def _load() -> Tuple[List[ConfigMeta], List[TemplateMeta], str]:
+            # 读取 VERSION
+            version = cls._cached(
+                _version['path'], _version_sig, lambda: cls._read_file(_version['path']))
+
+            # 读取并校验 cc_configs_meta
+            _cc_configs_meta = cls._cached(
+                _configs_meta['path'],
+                _configs_meta_sig,
+                lambda: cls._load_meta_file(_configs_meta, ConfigMeta, _validate_config_meta)
+            )
+
+            # 读取并校验 cc_templates_meta，检查数据中的 template 文件是否真实存在
+            _templates_list = cls._cached(
+                _templates['path'], _templates_sig, lambda: frozenset(os.listdir(_templates['path'])))
+
+            def _validate_template_meta(record: TemplateMeta) -> None:
+                if record.template_name not in _templates_list:
+                    raise CcTemplateNotFoundError(f'template file not found: {record.template_name}')
+
+            _cc_templates_meta = cls._cached(
+                f"{_templates_meta['path']}::validated",
+                (_templates_meta_sig, _templates_sig),
+                lambda: cls._load_meta_file(_templates_meta, TemplateMeta, _validate_template_meta)
+            )
 
-        return _cc_configs_meta, _cc_templates_meta, version
+            return _cc_configs_meta, _cc_templates_meta, version
+
+        # 全部文件均未变化时，直接返回已校验的结果
+        return cls._cached(
+            f'{resource_base_path}::library',
+            (_version_sig, _configs_meta_sig, _templates_meta_sig, _templates_sig),
+            _load
+        )
 
     @classmethod
-    def get_template_content(
+    def render_template(
             cls,
             namespace: str,
-            template_name,
+            template_name: str,
+            **envs
     ) -> str:
-        _template_path = os.path.join(ini.resources_path, namespace, 'templates', template_name)
-        # 检查模板是否存在
+        """
+        通过模板文件 loader 渲染模板，编译结果缓存在内存及磁盘中，模板文件修改后自动重新编译
+        """
         try:
-            _ = open(_template_path)
-            _.close()
-        except FileNotFoundError:
+            return JinjaHandler.render_file(f'{namespace}/templates/{template_name}', **envs)
+        except TemplateNotFound:
             raise CcTemplateNotFoundError
-
-        # 读取
-        with open(_template_path, mode='r', encoding='utf-8') as f:
-            _ = f.read()
-
-        return _
@@ -1,22 +1,152 @@
 import os
-from typing import List
+import hashlib
+from typing import List, Dict, Set, Tuple
+import jinja2
+from jinja2 import nodes, meta
 
 import ini
+from errors import CcResourcesError
+from utils.jinja_handler import JinjaHandler
+from utils.lru_cache import NamespaceLRUCache, MISSING
+from utils.resources_handler import ResourcesHandle
+
+
+# 渲染环境中的配置组：myself 为自身配置，snow 为 snow 配置，ini 仅在 snow 自身注册时提供
+reference_groups = ('myself', 'snow', 'ini')
+# 以变量、循环等非常量方式访问配置组时，无法静态确定引用的配置键，记为引用该组全部配置键
+any_key = '*'
+# cc_templates_meta 中参与渲染的字段
+templates_meta_fields = ('dest_address', 'dest_path', 'dest_user', 'dest_passwd')
 
 
 # 模板库操作类
 class TemplatesLibHandle:
+    """
+    配置键依赖索引：由 jinja 语法树解析模板文件及元数据中的配置引用，索引 配置键 -> 引用它的模板、配置、模板元数据
+
+    - 模板文件按 mtime 及大小缓存解析结果，元数据中的字符串按内容摘要缓存解析结果，资源变化时仅重新解析变化的部分
+    - 全部资源均未变化时直接返回缓存的索引
+    """
+    # 解析结果缓存：内容摘要 -> 引用集合
+    _references_cache = NamespaceLRUCache(max_size=int(ini.jinja_cache_max_size), ttl=float('inf'))
+
+    @classmethod
+    def find_references(cls, source: str) -> Set[Tuple[str, str]]:
+        """
+        :param source: 模板内容
+        :return: {(配置组, 配置键)}，配置键为 * 时表示引用该组全部配置键；存在语法错误的内容返回空集合
+        """
+        if not isinstance(source, str) or ('{' not in source):
+            return set()
+        _digest = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        _references = cls._references_cache.get('', _digest)
+        if _references is MISSING:
+            _references = cls._parse_references(source)
+            cls._references_cache.set('', _digest, _references)
+        return _references
+
+    @staticmethod
+    def _parse_references(source: str) -> Set[Tuple[str, str]]:
+        try:
+            _ast = JinjaHandler.parse(source)
+        except jinja2.TemplateSyntaxError:
+            return set()
+        # 模板内通过 set、for 等声明的同名变量不属于配置组
+        _groups = meta.find_undeclared_variables(_ast) & set(reference_groups)
+        if not _groups:
+            return set()
+
+        _references = set()
+        _static_names = set()
+        # myself.key 及 myself['key'] 形式的静态访问
+        for _n in _ast.find_all((nodes.Getattr, nodes.Getitem)):
+            if not (isinstance(_n.node, nodes.Name) and _n.node.name in _groups):
+                continue
+            if isinstance(_n, nodes.Getattr):
+                _references.add((_n.node.name, _n.attr))
+            elif isinstance(_n.arg, nodes.Const) and isinstance(_n.arg.value, str):
+                _references.add((_n.node.name, _n.arg.value))
+            else:
+                continue
+            _static_names.add(id(_n.node))
+        # 其余访问方式（如 myself[var]、for k in myself）
+        for _n in _ast.find_all(nodes.Name):
+            if _n.name in _groups and _n.ctx == 'load' and id(_n) not in _static_names:
+                _references.add((_n.name, any_key))
+        return _references
+
     @classmethod
-    def search_templates(cls, namespace: str, config_keys: List[str]) -> List[str]:
-        library_path = os.path.join(ini.resources_path, namespace)
-
-        _result_templates = []
-        for _t in os.listdir(library_path):
-            if os.path.isfile(os.path.join(library_path, _t)):
-                with open(os.path.join(library_path, _t), encoding='utf-8', mode='r') as f:
-                    content = f.read()
-                for _c in config_keys:
-                    if '{{ '+_c+' }}' in content:
-                        _result_templates.append(_t)
-                        break
-        return _result_templates
+    def get_dependency_index(cls, namespace: str) -> Dict[Tuple[str, str], Dict[str, Set[str]]]:
+        """
+        :return: (配置组, 配置键) -> {'templates': 模板名称, 'configs': 配置键, 'templates_meta': 模板名称}；
+            返回的数据为缓存共享对象，调用方不可修改
+        """
+        _cc_configs_meta, _cc_templates_meta, _ = ResourcesHandle.get_library_data(namespace)
+        _templates_path = os.path.join(ini.resources_path, namespace, 'templates')
+        try:
+            with os.scandir(_templates_path) as it:
+                _templates = sorted(
+                    (_e.name, _e.path, ResourcesHandle._signature(_e.stat())) for _e in it if _e.is_file())
+        except FileNotFoundError:
+            raise CcResourcesError(f"Resource path: [templates] not found.")
+
+        def _build() -> Dict[Tuple[str, str], Dict[str, Set[str]]]:
+            _index = {}
+
+            def _add(reference: Tuple[str, str], kind: str, name: str):
+                _index.setdefault(
+                    reference, {'templates': set(), 'configs': set(), 'templates_meta': set()})[kind].add(name)
+
+            for _name, _path, _sig in _templates:
+                _content = ResourcesHandle._cached(_path, _sig, lambda: ResourcesHandle._read_file(_path))
+                for _r in cls.find_references(_content):
+                    _add(_r, 'templates', _name)
+            for _m in _cc_configs_meta:
+                for _r in cls.find_references(_m.value):
+                    _add(_r, 'configs', _m.key)
+            for _m in _cc_templates_meta:
+                for _f in templates_meta_fields:
+                    for _r in cls.find_references(getattr(_m, _f)):
+                        _add(_r, 'templates_meta', _m.template_name)
+            return _index
+
+        # 元数据由 get_library_data 缓存，未变化时返回同一对象，签名比较时直接以对象标识判等
+        return ResourcesHandle._cached(
+            f'{os.path.join(ini.resources_path, namespace)}::dependency_index',
+            (_cc_configs_meta, _cc_templates_meta, tuple(_templates)),
+            _build
+        )
+
+    @classmethod
+    def search_dependants(
+            cls,
+            namespace: str,
+            config_key: str,
+            group: str = 'myself',
+            transitive: bool = True
+    ) -> Dict[str, List[str]]:
+        """
+        查询 namespace 内引用了指定配置键的模板、配置及模板元数据
+        :param group: 配置键所属的配置组，myself 为 namespace 自身配置，snow 为 snow 配置
+        :param transitive: 是否包含间接引用：配置值中引用了该配置键的配置（仅 myself 组内），其引用方也一并返回
+        """
+        _index = cls.get_dependency_index(namespace)
+        _empty = {'templates': set(), 'configs': set(), 'templates_meta': set()}
+
+        _result = {'templates': set(), 'configs': set(), 'templates_meta': set()}
+        _pending = [(group, config_key)]
+        _visited = set()
+        while _pending:
+            _reference = _pending.pop()
+            if _reference in _visited:
+                continue
+            _visited.add(_reference)
+            for _kind, _names in _index.get(_reference, _empty).items():
+                _result[_kind] |= _names
+            if transitive:
+                _pending.extend(('myself', _k) for _k in _index.get(_reference, _empty)['configs'])
+        # 以非常量方式访问配置组的引用方，视为引用了该组的任一配置键
+        for _g in {_r[0] for _r in _visited}:
+            for _kind, _names in _index.get((_g, any_key), _empty).items():
+                _result[_kind] |= _names
+        return {_k: sorted(_v) for _k, _v in _result.items()}